@@ -0,0 +1,83 @@
+"""模型输出的容错解析：去掉思考过程，从 "答案&&依据"、JSON 或自由文本中提取选项字母"""
+
+import json
+import re
+
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.S)
+_JSON_OBJECT = re.compile(r"\{.*\}", re.S)
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+# markdown 强调包住的选项字母，如 **B**、*A、C*、__D__
+_EMPHASIZED_LETTERS = re.compile(r"(\*{1,2}|_{1,2})([A-Z](?:[,，、]?[A-Z])*)\1")
+# 自由文本中的答案，按可信度从高到低尝试；中文字符也属于 \w，字母边界用 (?![A-Za-z])
+_ANSWER_PATTERNS = (
+    re.compile(
+        r"(?:正确)?答案\s*(?:是|为|选)?\s*[:：]?\s*"
+        r"([A-Z](?:[,，、]?[A-Z])*)(?![A-Za-z])"
+    ),
+    re.compile(r"选(?:择)?\s*([A-Z])(?![A-Za-z])"),
+    re.compile(r"^\s*[(（]?([A-Z])[)）]?(?:[.．、:：\s]|$)"),
+)
+
+
+class AnswerParseError(ValueError):
+    """模型输出中找不到有效的选项字母"""
+
+
+def strip_thinking(text):
+    """去掉 <think>...</think> 思考过程；只有结束标签时（开头标签在模板中）去掉其之前的内容"""
+    text = _THINK_BLOCK.sub("", text or "")
+    if "</think>" in text:
+        text = text.split("</think>", 1)[1]
+    elif "<think>" in text:
+        # 思考过程被截断，没有正式回答
+        text = text.split("<think>", 1)[0]
+    return text.strip()
+
+
+def extract_json(text):
+    """提取输出中的第一个 JSON 对象，找不到或解析失败时返回 None"""
+    text = _CODE_FENCE.sub("", strip_thinking(text))
+    match = _JSON_OBJECT.search(text)
+    if not match:
+        return None
+    try:
+        value = json.loads(match.group(0))
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def valid_answer(answer, options):
+    """答案归一化为大写选项字母，不是给定选项时返回 None"""
+    letters = re.sub(r"[\s,，、*_]", "", str(answer)).upper()
+    if letters and all(letter in options for letter in letters):
+        return letters
+    return None
+
+
+def parse_answer(text, options):
+    """解析单道题的输出，返回 (答案字母, 依据)
+
+    依次尝试 JSON（{"answer", "reason"}）、"答案&&依据" 格式和自由文本中的
+    "答案是 B" 等表述，都失败时抛出 AnswerParseError。选项字母外的 markdown 强调
+    （如 **B**&&理由）先去掉。
+    """
+    body = _EMPHASIZED_LETTERS.sub(r"\2", strip_thinking(text))
+    data = extract_json(body)
+    if data is not None and "answer" in data:
+        answer = valid_answer(data["answer"], options)
+        if answer is not None:
+            return answer, str(data.get("reason", ""))
+
+    if "&&" in body:
+        first_part, second_part = body.split("&&", 1)
+        answer = valid_answer(first_part, options)
+        if answer is not None:
+            return answer, second_part.strip()
+
+    for pattern in _ANSWER_PATTERNS:
+        for match in pattern.finditer(body):
+            answer = valid_answer(match.group(1), options)
+            if answer is not None:
+                return answer, body
+    raise AnswerParseError(f"no valid option in model output: {body[:80]!r}")
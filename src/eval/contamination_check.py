@@ -0,0 +1,173 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from collections import Counter, defaultdict
+
+# 知识库文档块的读取模块（chunk_store.py）位于 src/rag
+RAG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rag")
+
+# 去掉题干开头的题号，如 "12. "、"3、"
+_QUESTION_NUMBER = re.compile(r"^\s*\d+\s*[.．、]\s*")
+_IGNORED_CHARS = re.compile(r"[\s，。、；：,.;:？?！!（）()“”\"'‘’•]+")
+
+
+def normalize(text):
+    """归一化文本：去掉空白和标点并转为小写"""
+    return _IGNORED_CHARS.sub("", text).lower()
+
+
+def question_key(question):
+    """题干的归一化哈希，用于将评测结果与污染报告对应"""
+    text = normalize(_QUESTION_NUMBER.sub("", question))
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def fingerprints(text, ngram=6, window=4):
+    """Winnowing 指纹：每个长度为 window 的窗口内取最小的 n-gram 哈希
+
+    两段文本只要有长度不小于 ngram + window - 1 的公共子串，就必定共享至少一个指纹。
+    """
+    if len(text) < ngram:
+        return {zlib.crc32(text.encode("utf-8"))} if text else set()
+    hashes = [
+        zlib.crc32(text[i : i + ngram].encode("utf-8"))
+        for i in range(len(text) - ngram + 1)
+    ]
+    if len(hashes) <= window:
+        return {min(hashes)}
+    return {min(hashes[i : i + window]) for i in range(len(hashes) - window + 1)}
+
+
+class ContaminationIndex:
+    """知识库文档块的指纹倒排索引"""
+
+    def __init__(self, ngram=6, window=4, max_postings=50):
+        self.ngram = ngram
+        self.window = window
+        # 出现在过多文档块中的指纹视为套话，不参与判断
+        self.max_postings = max_postings
+        self.postings = defaultdict(list)
+        self.texts = {}
+
+    def add(self, chunk_id, text):
+        text = normalize(text)
+        self.texts[chunk_id] = text
+        for fp in fingerprints(text, self.ngram, self.window):
+            self.postings[fp].append(chunk_id)
+
+    def check(self, text, near_threshold=0.5, top=3):
+        """返回 (状态, [(文档块编号, 包含度)])，状态为 exact / near / clean
+
+        包含度为题目指纹中出现在该文档块里的比例。
+        """
+        text = normalize(text)
+        fps = fingerprints(text, self.ngram, self.window)
+        if not fps:
+            return "clean", []
+
+        hits = Counter()
+        for fp in fps:
+            chunk_ids = self.postings.get(fp)
+            if chunk_ids and len(chunk_ids) <= self.max_postings:
+                hits.update(chunk_ids)
+
+        matches = [
+            (chunk_id, round(count / len(fps), 3))
+            for chunk_id, count in hits.most_common(top)
+        ]
+        if not matches or matches[0][1] < near_threshold:
+            return "clean", []
+        if any(text in self.texts[chunk_id] for chunk_id, _ in matches):
+            return "exact", matches
+        return "near", matches
+
+
+def iter_question_files(pattern):
+    """逐题读取评测集，兼容 JSON 数组和 JSONL"""
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "r", encoding="utf-8") as f:
+            items = (
+                (json.loads(line) for line in f if line.strip())
+                if path.endswith(".jsonl")
+                else json.load(f)
+            )
+            for index, item in enumerate(items, start=1):
+                yield os.path.basename(path), index, item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查评测题目是否出现在知识库中")
+    parser.add_argument(
+        "--chunks", help="知识库文档块文件；不指定时使用知识库上线版本的 chunks.jsonl"
+    )
+    parser.add_argument(
+        "--persist-dir",
+        default="data_base/vector_db/408.db",
+        help="不指定 --chunks 时，从该知识库的版本清单中查找上线版本",
+    )
+    parser.add_argument("--alias", help="知识库别名，默认 rag_collection")
+    parser.add_argument(
+        "--questions", default="data/test_data/*.json*", help="评测集文件（glob）"
+    )
+    parser.add_argument(
+        "--output", default="output/contamination.jsonl", help="污染报告输出路径"
+    )
+    parser.add_argument("--near-threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if not args.chunks:
+        if RAG_DIR not in sys.path:
+            sys.path.insert(0, RAG_DIR)
+        from chunk_store import CHUNKS_FILE, live_chunks_dir
+
+        chunks_dir = live_chunks_dir(args.persist_dir, args.alias)
+        if not chunks_dir:
+            parser.error("版本清单中没有上线版本的文档块目录，请用 --chunks 指定文档块文件")
+        args.chunks = os.path.join(chunks_dir, CHUNKS_FILE)
+        print(f"使用上线版本的文档块 {args.chunks}")
+
+    start = time.perf_counter()
+    index = ContaminationIndex()
+    with open(args.chunks, "r", encoding="utf-8") as f:
+        for line in f:
+            chunk = json.loads(line)
+            index.add(chunk["id"], chunk["text"])
+    print(f"索引 {len(index.texts)} 个文档块，用时 {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    stats = Counter()
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as out:
+        for source, number, item in iter_question_files(args.questions):
+            stem = _QUESTION_NUMBER.sub("", item["question"])
+            # 先只看题干；题干未命中时再连同选项一起计算包含度
+            status, matches = index.check(stem, args.near_threshold)
+            if status == "clean" and item.get("options"):
+                full = stem + "".join(item["options"].values())
+                status, matches = index.check(full, args.near_threshold)
+            stats[status] += 1
+            record = {
+                "source": source,
+                "question_id": item.get("question_id", number),
+                "question_key": question_key(item["question"]),
+                "status": status,
+                "chunks": matches,
+            }
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    total = sum(stats.values())
+    print(
+        f"检查 {total} 道题，用时 {time.perf_counter() - start:.2f}s："
+        f"原文命中 {stats['exact']}，近似命中 {stats['near']}，干净 {stats['clean']}"
+    )
+    print(f"污染报告已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
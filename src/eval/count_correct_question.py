@@ -1,6 +1,7 @@
 import json
 import os
 import re
+from contamination_check import question_key
 
 
 # 检查答案是否正确
@@ -13,6 +14,8 @@ def check_ans(input_item):
         "模型结果": input_item["模型结果"],
         "正确答案": input_item["正确答案"],
         "模型依据": input_item["模型依据"],
+        # 多次重试仍未解析出答案的题目（test_question.py 记录了失败原因）
+        "解析失败": "失败原因" in input_item,
     }
     print(f"没有找到病案号为{id}的诊断结果！")
 
@@ -40,7 +43,26 @@ with open(
     result_dic = {
         "正确个数": correct_number,
         "正确率": correct_number / len(answer_result),
+        "解析失败个数": sum(item["解析失败"] for item in answer_result),
         "详细结果": answer_result,
     }
+
+    # 有污染报告时（contamination_check.py 生成），分别统计干净题与污染题的正确率
+    contamination_path = "output/contamination.jsonl"
+    if os.path.exists(contamination_path):
+        with open(contamination_path, "r", encoding="utf-8") as f_report:
+            status_by_key = {}
+            for line in f_report:
+                record = json.loads(line)
+                status_by_key[record["question_key"]] = record["status"]
+        subsets = {}
+        for item in answer_result:
+            status = status_by_key.get(question_key(item["问题"]), "unknown")
+            subset = subsets.setdefault(status, {"个数": 0, "正确个数": 0})
+            subset["个数"] += 1
+            subset["正确个数"] += item["测试结果"] is True
+        for subset in subsets.values():
+            subset["正确率"] = subset["正确个数"] / subset["个数"]
+        result_dic["污染分组"] = subsets
     print(result_dic)
     f_result.write(json.dumps(result_dic, ensure_ascii=False, indent=4))
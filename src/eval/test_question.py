@@ -3,18 +3,36 @@ import json
 from tqdm import tqdm
 import random
 import os
-import copy
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from answer_parser import (
+    AnswerParseError,
+    extract_json,
+    parse_answer,
+    strip_thinking,
+    valid_answer,
+)
 
 if "SSL_CERT_FILE" in os.environ:
     del os.environ["SSL_CERT_FILE"]
 
-client = OpenAI(api_key="YOUR_API_KEY", base_url="http://localhost:8000/v1")
-model_name = client.models.list().data[0].id
-
-test_path = "data/test_data/computer-408-exam-questions-400.json"
-
-output_folder = "output/400_question"
-os.makedirs(output_folder, exist_ok=True)
+DEFAULT_BASE_URL = "http://localhost:8000/v1"
+DEFAULT_TEST_PATH = "data/test_data/computer-408-exam-questions-400.json"
+DEFAULT_OUTPUT_PATH = "output/400_question/qwen3_8b_400_question.jsonl"
+# .qbank 题库的读取模块（question_store.py）位于 src/preprocess
+PREPROCESS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "preprocess"
+)
+# 作答和写入结果只需要的字段；题号用于续跑时匹配已完成的题目
+EVAL_FIELDS = ("question_id", "question", "options", "answer")
+EVAL_MODES = ("single", "packed", "offline")
+# OpenAI 兼容的离线批处理接口按在线价格的一半计费
+OFFLINE_DISCOUNT = 0.5
+# 单题请求失败或输出无法解析时的重试次数和首次重试前的等待时间（秒，指数退避）
+MAX_RETRIES = 2
+RETRY_BACKOFF = 1.0
 
 
 # 系统消息模板
@@ -31,65 +49,568 @@ system_message = {
 }
 
 
-def history_chat(messages):
+# 多题打包模式的系统消息：一次请求回答多道题，以 JSON 返回每道题的答案
+batch_system_message = {
+    "role": "system",
+    "content": """你作为精通计算机知识的专业答题助手，需依据计算机相关知识点对选择题进行解答。本次任务会一次给出多道计算机领域选择题，每道题带有编号 id、题干和选项。请严格遵循以下规则：
+1、答案仅限从题目给定的选项中选取，禁止脱离选项范围进行选择
+2、每道题都要作答，不得遗漏
+3、只输出一个 JSON 对象，不要输出其他内容，格式为：
+{"answers": [{"id": 题目编号, "answer": "正确选项字母", "reason": "以计算机知识逻辑阐述选择该答案的依据"}]}
+输出示例：{"answers": [{"id": 1, "answer": "B", "reason": "CPU 的核心功能是执行指令、进行数据处理，数据存储、输入和输出分别由存储设备、输入设备和输出设备完成。"}]}
+""",
+}
+
+# JSON 模式的系统消息：服务端支持 response_format 时要求单题以 JSON 作答
+json_system_message = {
+    "role": "system",
+    "content": """你作为精通计算机知识的专业答题助手，需依据计算机相关知识点对选择题进行解答。本次任务的题目为计算机领域选择题，包含题干、选项及相关计算机背景信息。请严格遵循以下规则：
+1、答案仅限从题目给定的选项中选取，禁止脱离选项范围进行选择
+2、只输出一个 JSON 对象，不要输出其他内容，格式为：
+{"answer": "正确选项字母", "reason": "以计算机知识逻辑阐述选择该答案的依据"}
+""",
+}
+
+
+class UsageMeter:
+    """累计请求数、token 用量和回退次数，用于比较各模式的吞吐和每题成本
+
+    离线批处理的 token 单独累计，只有这部分按 batch_discount 计费；
+    离线模式回退到在线逐题作答的请求按在线价格计费。
+    """
+
+    def __init__(self, batch_discount=OFFLINE_DISCOUNT):
+        self.batch_discount = batch_discount
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.batch_prompt_tokens = 0
+        self.batch_completion_tokens = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def add(self, usage, requests=1):
+        if usage is None:
+            self.add_tokens(0, 0, requests)
+        else:
+            self.add_tokens(usage.prompt_tokens, usage.completion_tokens, requests)
+
+    def add_tokens(self, prompt_tokens, completion_tokens, requests=1, batch=False):
+        """batch=True 表示 token 来自离线批处理接口"""
+        with self._lock:
+            self.requests += requests
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            if batch:
+                self.batch_prompt_tokens += prompt_tokens
+                self.batch_completion_tokens += completion_tokens
+
+    def add_fallbacks(self, count):
+        with self._lock:
+            self.fallbacks += count
+
+    def report(self, questions, elapsed, price_input=0.0, price_output=0.0):
+        """price_input/price_output 为每百万 token 的价格"""
+        questions = max(questions, 1)
+        online_prompt = self.prompt_tokens - self.batch_prompt_tokens
+        online_completion = self.completion_tokens - self.batch_completion_tokens
+        batch_cost = (
+            self.batch_prompt_tokens * price_input
+            + self.batch_completion_tokens * price_output
+        ) * self.batch_discount
+        cost = (
+            online_prompt * price_input + online_completion * price_output + batch_cost
+        ) / 1_000_000
+        return {
+            "questions": questions,
+            "requests": self.requests,
+            "fallbacks": self.fallbacks,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_qps": round(questions / elapsed, 3) if elapsed else 0.0,
+            "prompt_tokens_per_question": round(self.prompt_tokens / questions, 1),
+            "completion_tokens_per_question": round(
+                self.completion_tokens / questions, 1
+            ),
+            "batch_token_ratio": round(
+                (self.batch_prompt_tokens + self.batch_completion_tokens)
+                / max(self.prompt_tokens + self.completion_tokens, 1),
+                4,
+            ),
+            "cost_per_question": round(cost / questions, 8),
+        }
+
+
+def history_chat(client, model_name, messages, meter=None, system=None, **kwargs):
     """使用已设置的system消息和用户问题进行对话"""
     # 合并system消息和用户消息
-    full_messages = [system_message] + messages
-    print(full_messages)
+    full_messages = [system or system_message] + messages
 
     # 调用API
     response = client.chat.completions.create(
         model=model_name,
         messages=full_messages,
         extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+        **kwargs,
     )
+    if meter is not None:
+        meter.add(response.usage)
 
     return response.choices[0].message.content
 
 
-# 读取输入数据
-test_data = []
-all_data = []
-with open(f"{test_path}", "r", encoding="utf-8") as file:
-    all_data = json.load(file)
-# print(data)
-data_len = len(all_data)  # len(all_data)
-random.shuffle(all_data)
-test_data = copy.deepcopy(all_data)
-for item in test_data:
-    # 先获取所有键的列表（副本），再遍历删除
-    for key in list(item.keys()):
-        if key not in ["question", "options"]:  # 仅保留question和options字段
-            item.pop(key, None)
-# 处理并写入结果
-
-
-with open(
-    os.path.join(output_folder, "qwen3_8b_400_question.jsonl"), "a", encoding="utf-8"
-) as f:
-    for index, item in tqdm(enumerate(test_data, start=1), total=data_len):
-        print(f"\n处理第 {index} 条记录")
-
-        # 只构建用户问题，不包含system模板
-        user_question = [{"role": "user", "content": f"问题和选项:{item}"}]
-
-        # 调用API获取回答
-        answer = history_chat(user_question)
-        print(answer)
-        # 移除前后的空白字符
-        first_part, second_part = answer.split("&&", 1)
-        print(first_part)
-        print(second_part)
-        output = {
-            "序号": index,
-            "问题": all_data[index - 1]["question"],
-            "选项": all_data[index - 1]["options"],
-            "模型结果": first_part,
-            "正确答案": all_data[index - 1]["answer"],
-            "模型依据": second_part,
+def _sample_rows(count, limit=None, seed=None):
+    """按 seed 不放回地抽取最多 limit 个行号；各种格式共用，同一 seed 和 limit 抽到相同的题目和顺序"""
+    return random.Random(seed).sample(range(count), min(limit or count, count))
+
+
+def load_test_data(test_path, limit=None, seed=None):
+    """读取评测集并按 seed 打乱，最多取 limit 道题；兼容 JSON 数组、JSONL 和 .qbank
+
+    .qbank 题库直接在映射内存上抽样，只解码被抽中题目的 EVAL_FIELDS 字段。
+    """
+    if test_path.endswith(".qbank"):
+        if PREPROCESS_DIR not in sys.path:
+            sys.path.insert(0, PREPROCESS_DIR)
+        from question_store import QuestionStore
+
+        with QuestionStore(test_path) as store:
+            rows = _sample_rows(len(store), limit, seed)
+            return list(store.select(rows, fields=EVAL_FIELDS))
+
+    with open(test_path, "r", encoding="utf-8") as file:
+        if test_path.endswith(".jsonl"):
+            all_data = [json.loads(line) for line in file if line.strip()]
+        else:
+            all_data = json.load(file)
+    return [all_data[row] for row in _sample_rows(len(all_data), limit, seed)]
+
+
+def user_message(item):
+    # 只发送question和options字段，不包含system模板；system 消息固定不变，构成可被
+    # 服务端前缀缓存复用的公共前缀，选项按字母排序使同一道题的请求逐字节相同
+    prompt_item = {
+        "question": item["question"].strip(),
+        "options": dict(sorted(item["options"].items())),
+    }
+    return {"role": "user", "content": f"问题和选项:{prompt_item}"}
+
+
+def make_record(index, item, model_answer, reason):
+    record = {
+        "序号": index,
+        "问题": item["question"],
+        "选项": item["options"],
+        "模型结果": model_answer,
+        "正确答案": item["answer"],
+        "模型依据": reason,
+    }
+    if item.get("question_id") is not None:
+        record["题号"] = item["question_id"]
+    return record
+
+
+def _record_key(question_id, question, options):
+    """续跑和整理结果时识别同一道题的键
+
+    题号在不同文件、不同章节间会重复（如各章都从 Q1 开始），"下列说法正确的是"
+    这类题干也会重复，因此题号、题干和选项三者一起才作为一道题的唯一标识。
+    """
+    options = sorted((str(k), str(v).strip()) for k, v in (options or {}).items())
+    return (question_id, question.strip(), tuple(options))
+
+
+def load_records(output_path):
+    """读取已有的结果文件，跳过中途退出时残留的半行"""
+    records = []
+    if not os.path.exists(output_path):
+        return records
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def compact_records(output_path):
+    """整理结果文件：每道题只保留一条记录，有成功记录时保留最后一条成功记录，
+    否则保留最后一条失败记录，顺序为题目首次出现的顺序。返回整理后的记录
+    """
+    slots = {}
+    order = []
+    for record in load_records(output_path):
+        key = _record_key(record.get("题号"), record["问题"], record["选项"])
+        current = slots.get(key)
+        if current is None:
+            order.append(key)
+        if current is None or "失败原因" not in record or "失败原因" in current:
+            slots[key] = record
+    records = [slots[key] for key in order]
+    if records:
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                json.dump(record, f, ensure_ascii=False)
+                f.write("\n")
+        os.replace(output_path + ".tmp", output_path)
+    return records
+
+
+def answer_question(
+    client,
+    model_name,
+    index,
+    item,
+    meter=None,
+    json_mode=False,
+    max_retries=MAX_RETRIES,
+):
+    """回答单道题目，返回写入结果文件的记录
+
+    请求出错或输出中找不到有效选项时最多重试 max_retries 次，仍失败时返回模型结果为空、
+    带有 "失败原因" 的记录，不会中断整个评测。json_mode=True 时先以 JSON 格式请求，
+    请求出错（服务端可能不支持 response_format）后改用普通格式。
+    """
+    errors = []
+    output = ""
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        try:
+            # 调用API获取回答
+            if json_mode:
+                output = history_chat(
+                    client,
+                    model_name,
+                    [user_message(item)],
+                    meter,
+                    system=json_system_message,
+                    response_format={"type": "json_object"},
+                )
+            else:
+                output = history_chat(client, model_name, [user_message(item)], meter)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            json_mode = False
+            continue
+        try:
+            answer, reason = parse_answer(output, item["options"])
+        except AnswerParseError as e:
+            errors.append(str(e))
+            continue
+        return make_record(index, item, answer, reason)
+
+    record = make_record(index, item, "", strip_thinking(output))
+    record["失败原因"] = errors
+    return record
+
+
+def parse_batch_answers(content, batch):
+    """解析打包请求的 JSON 输出，返回 {序号: (答案, 依据)}，只包含通过校验的题目
+
+    batch 为 [(序号, 题目)]；输出无法解析时返回空字典。
+    """
+    data = extract_json(content)
+    answers = data.get("answers") if data is not None else None
+    if not isinstance(answers, list):
+        return {}
+
+    items = dict(batch)
+    parsed = {}
+    for entry in answers:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            index = int(entry.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if index not in items or index in parsed:
+            continue
+        answer = valid_answer(entry.get("answer", ""), items[index]["options"])
+        if answer is not None:
+            parsed[index] = (answer, str(entry.get("reason", "")))
+    return parsed
+
+
+def answer_batch(client, model_name, batch, meter=None, **options):
+    """一次请求回答多道题目，解析失败或校验不通过的题目逐题重新作答
+
+    options 传给逐题作答的 answer_question（json_mode、max_retries）。
+    """
+    questions = [
+        {"id": index, "question": item["question"], "options": item["options"]}
+        for index, item in batch
+    ]
+    content = json.dumps(questions, ensure_ascii=False)
+    try:
+        answer = history_chat(
+            client,
+            model_name,
+            [{"role": "user", "content": f"题目列表:{content}"}],
+            meter,
+            system=batch_system_message,
+            response_format={"type": "json_object"},
+        )
+        parsed = parse_batch_answers(answer, batch)
+    except Exception as e:
+        print(f"打包请求失败，逐题作答: {e}")
+        parsed = {}
+
+    records = []
+    missing = 0
+    for index, item in batch:
+        if index in parsed:
+            records.append(make_record(index, item, *parsed[index]))
+        else:
+            missing += 1
+            records.append(
+                answer_question(client, model_name, index, item, meter, **options)
+            )
+    if missing and meter is not None:
+        meter.add_fallbacks(missing)
+    return records
+
+
+def answer_offline(
+    client, model_name, indexed, meter=None, poll_interval=10, timeout=None
+):
+    """通过 OpenAI 兼容的 /v1/batches 离线接口提交全部题目，返回 {序号: 模型输出}
+
+    接口不可用或批任务失败时抛出异常；单条请求失败的题目不在返回结果中。
+    timeout（秒）内批任务未完成时取消该任务并抛出 TimeoutError。
+    """
+    lines = []
+    for index, item in indexed:
+        body = {
+            "model": model_name,
+            "messages": [system_message, user_message(item)],
+            "chat_template_kwargs": {"enable_thinking": False},
         }
-        # 写入结果
-        json.dump(output, f, ensure_ascii=False)
-        f.write("\n")
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": str(index),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                },
+                ensure_ascii=False,
+            )
+        )
+    input_file = client.files.create(
+        file=("eval_batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if deadline is not None and time.monotonic() >= deadline:
+            client.batches.cancel(batch.id)
+            raise TimeoutError(f"离线批任务 {batch.id} 超过 {timeout} 秒未完成，已取消")
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        counts = getattr(batch, "request_counts", None)
+        if counts is not None:
+            print(
+                f"离线批任务 {batch.id} {batch.status}: "
+                f"完成 {counts.completed}/{counts.total}，失败 {counts.failed}"
+            )
+        else:
+            print(f"离线批任务 {batch.id} {batch.status}")
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"离线批任务 {batch.id} 状态为 {batch.status}")
+
+    answers = {}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        body = response["body"]
+        if meter is not None:
+            usage = body.get("usage") or {}
+            meter.add_tokens(
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+                0,
+                batch=True,
+            )
+        answers[int(result["custom_id"])] = body["choices"][0]["message"]["content"]
+    if meter is not None:
+        # 整个批任务计为一次请求
+        meter.add(None)
+    return answers
+
+
+def _offline_records(
+    client, model_name, indexed, meter, pool, batch_timeout=None, **options
+):
+    try:
+        answers = answer_offline(
+            client, model_name, indexed, meter, timeout=batch_timeout
+        )
+    except Exception as e:
+        print(f"离线批处理不可用，改为逐题在线作答: {e}")
+        answers = {}
+
+    def record(args):
+        index, item = args
+        if index in answers:
+            try:
+                return make_record(
+                    index, item, *parse_answer(answers[index], item["options"])
+                )
+            except AnswerParseError:
+                pass
+        meter.add_fallbacks(1)
+        return answer_question(client, model_name, index, item, meter, **options)
+
+    return pool.map(record, indexed)
+
+
+def run_eval(
+    test_path=DEFAULT_TEST_PATH,
+    output_path=DEFAULT_OUTPUT_PATH,
+    base_url=DEFAULT_BASE_URL,
+    api_key="YOUR_API_KEY",
+    model_name=None,
+    concurrency=1,
+    limit=None,
+    seed=None,
+    mode="single",
+    batch_size=8,
+    price_input=0.0,
+    price_output=0.0,
+    report_path=None,
+    json_mode=False,
+    max_retries=MAX_RETRIES,
+    batch_timeout=None,
+    resume=True,
+    retry_failed=False,
+):
+    """运行选择题评测，结果逐条追加写入 output_path，返回写入条数
+
+    mode 为 "single" 时每题一次请求；"packed" 时每 batch_size 道题打包为一次请求，
+    以 JSON 返回各题答案；"offline" 时通过离线批处理接口提交全部题目。后两种模式下
+    解析失败的题目逐题重新作答。结束时输出吞吐和每题成本（价格为每百万 token）。
+    单题多次重试仍失败时写入带 "失败原因" 的记录并继续评测。
+    离线批任务超过 batch_timeout 秒未完成时取消，改为逐题在线作答。
+
+    resume=True 时跳过 output_path 中已有成功记录的题目（按题号或题干匹配），
+    中断后重跑只作答剩余题目；retry_failed=True 时只重新作答带 "失败原因" 的记录。
+    结束时整理结果文件，每道题只保留一条记录（成功记录优先）。
+    """
+    if mode not in EVAL_MODES:
+        raise ValueError(f"unknown eval mode: {mode}")
+    client = OpenAI(api_key=api_key, base_url=base_url)
+    if model_name is None:
+        model_name = client.models.list().data[0].id
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    existing = compact_records(output_path) if resume or retry_failed else []
+    if retry_failed:
+        indexed = [
+            (
+                record["序号"],
+                {
+                    "question_id": record.get("题号"),
+                    "question": record["问题"],
+                    "options": record["选项"],
+                    "answer": record["正确答案"],
+                },
+            )
+            for record in existing
+            if "失败原因" in record
+        ]
+        print(f"重新作答 {len(indexed)} 道失败的题目")
+    else:
+        done = {
+            _record_key(record.get("题号"), record["问题"], record["选项"])
+            for record in existing
+            if "失败原因" not in record
+        }
+        all_data = load_test_data(test_path, limit, seed)
+        indexed = [
+            (index, item)
+            for index, item in enumerate(all_data, start=1)
+            if _record_key(item.get("question_id"), item["question"], item["options"])
+            not in done
+        ]
+        if len(indexed) < len(all_data):
+            print(
+                f"跳过 {len(all_data) - len(indexed)} 道已有成功记录的题目，"
+                f"作答剩余 {len(indexed)} 道"
+            )
+    meter = UsageMeter()
+    options = {"json_mode": json_mode, "max_retries": max_retries}
+    count = 0
+    failed = 0
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as f, ThreadPoolExecutor(
+        max_workers=concurrency
+    ) as pool:
+        # map 保持题目顺序，多个请求并发执行
+        if mode == "packed":
+            batches = [
+                indexed[i : i + batch_size] for i in range(0, len(indexed), batch_size)
+            ]
+            results = (
+                record
+                for records in pool.map(
+                    lambda batch: answer_batch(
+                        client, model_name, batch, meter, **options
+                    ),
+                    batches,
+                )
+                for record in records
+            )
+        elif mode == "offline":
+            results = _offline_records(
+                client, model_name, indexed, meter, pool, batch_timeout, **options
+            )
+        else:
+            results = pool.map(
+                lambda args: answer_question(
+                    client, model_name, *args, meter=meter, **options
+                ),
+                indexed,
+            )
+        for output in tqdm(results, total=len(indexed)):
+            # 写入结果，逐条刷新到磁盘，中途退出时已完成的题目不会丢失
+            json.dump(output, f, ensure_ascii=False)
+            f.write("\n")
+            f.flush()
+            count += 1
+            failed += "失败原因" in output
+
+    if resume or retry_failed:
+        compact_records(output_path)
+
+    report = {
+        "mode": mode,
+        "batch_size": batch_size if mode == "packed" else 1,
+        "parse_failures": failed,
+        **meter.report(count, time.perf_counter() - start, price_input, price_output),
+    }
+    print(f"共写入{count}条记录，其中{failed}道题多次重试后仍未得到有效答案")
+    print(
+        f"模式 {mode}: 请求 {report['requests']} 次（回退 {report['fallbacks']} 题），"
+        f"吞吐 {report['throughput_qps']} 题/秒，"
+        f"每题 {report['prompt_tokens_per_question']} + "
+        f"{report['completion_tokens_per_question']} tokens，"
+        f"每题成本 {report['cost_per_question']}"
+    )
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as rf:
+            json.dump(report, rf, ensure_ascii=False, indent=2)
+            rf.write("\n")
+    return count
+
 
-    print(f"共写入{index}条记录")
+if __name__ == "__main__":
+    run_eval()
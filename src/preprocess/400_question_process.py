@@ -1,6 +1,6 @@
 import os
 import json
-import re
+from qa_parser import QuestionParser, Docx400Rules, write_jsonl
 from unstructured.partition.docx import partition_docx
 
 def process_docx_to_json(source_dir, output_dir):
@@ -24,11 +24,10 @@ def process_docx_to_json(source_dir, output_dir):
             except Exception as e:
                 print(f"处理 {filename} 时出错: {e}")
 
-def combine_qa_from_json(source_dir, output_file):
+def iter_qa_from_json(source_dir):
     """
-    从JSON文件中提取题目、选项和答案，并添加学科分类信息
+    从JSON文件中逐题提取题目、选项和答案，并添加学科分类信息
     """
-    all_qa = []
     # 定义文档前缀与学科分类的映射
     subject_mapping = {
         "ComputerArchitecture": "计算机组成原理",
@@ -49,58 +48,21 @@ def combine_qa_from_json(source_dir, output_file):
             # 获取对应学科分类，默认未知类型
             subject_category = subject_mapping.get(doc_prefix, "未知类型")
             
-            i = 0
-            while i < len(data):
-                element = data[i]
-                text = element.get("text", "").strip()
-                
-                # 识别题号模式
-                if re.match(r'^\d+[.、]', text):
-                    question = text
-                    options = {}
-                    answer = ""
-                    
-                    # 提取选项
-                    if i + 1 < len(data):
-                        options_text = data[i+1].get("text", "").strip()
-                        if options_text and options_text[0].upper() in ['A', 'B', 'C', 'D']:
-                            option_pattern = r'([A-E])[.\s]+(.+?)(?=[B-E][.\s]|$)'
-                            options_matches = re.findall(option_pattern, options_text, re.DOTALL)
-                            for letter, content in options_matches:
-                                options[letter] = content.strip()
-                    
-                    # 提取答案
-                    answer_index = None
-                    for offset in [2, 3]:
-                        if i + offset < len(data):
-                            answer_text = data[i+offset].get("text", "").strip()
-                            if answer_text.startswith("**答案："):
-                                answer = answer_text.replace("**答案：", "").replace("**", "").strip()
-                                answer_index = i + offset
-                                break
-                    
-                    if answer_index:
-                        i = answer_index
-                    
-                    if question and options and answer:
-                        all_qa.append({
-                            "question": question,
-                            "options": options,
-                            "answer": answer,
-                            "subject_category": subject_category  # 蛇形命名
-                        })
-                
-                i += 1
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_qa, f, ensure_ascii=False, indent=4)
-    
-    print(f"成功合并所有题目到 {output_file}")
+            records = ((None, element.get("text", "")) for element in data)
+            parser = QuestionParser(Docx400Rules(subject_category))
+            yield from parser.parse(records)
+
+def combine_qa_from_json(source_dir, output_file):
+    """
+    合并所有题目并增量写入 JSONL
+    """
+    count = write_jsonl(iter_qa_from_json(source_dir), output_file)
+    print(f"成功合并 {count} 道题目到 {output_file}")
 
 if __name__ == "__main__":
     source_directory = "data/docx_data"
     output_directory = "output/processed_data"
-    combined_output_file = "data/test_data/computer_408_exam_questions_400.json"
+    combined_output_file = "data/test_data/computer_408_exam_questions_400.jsonl"
     
     process_docx_to_json(source_directory, output_directory)
     combine_qa_from_json(output_directory, combined_output_file)
\ No newline at end of file
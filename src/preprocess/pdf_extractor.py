@@ -0,0 +1,221 @@
+import os
+import io
+import json
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+from PIL import Image
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 页面文本缓存目录（项目根目录下，与运行脚本时的工作目录无关），按 PDF 内容哈希区分
+DEFAULT_CACHE_DIR = os.path.join(PROJECT_DIR, ".cache", "pdf_pages")
+# 缓存格式变化时递增，使旧缓存失效
+CACHE_VERSION = 2
+
+
+def file_sha256(path):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def inspect_image(data):
+    """只解码一次，同时完成图片有效性校验和格式识别；无效图片返回 None"""
+    try:
+        img = Image.open(io.BytesIO(data))
+        img_format = img.format.lower() if img.format else "png"
+        img.verify()  # 验证图片完整性
+        return img_format
+    except Exception as e:
+        logging.error(f"无效图片数据: {str(e)}")
+        return None
+
+
+def _save_page_images(page, page_num, image_dir):
+    """保存单页中的有效图片，按纵坐标排序后返回图片信息列表
+
+    图片按内容哈希命名，页眉、logo 等重复图片只保存一次。
+    """
+    images = []
+    for img_idx, img in enumerate(page.images):
+        try:
+            # 针对习题册中可能的矢量图/嵌入式图片处理
+            img_data = img["stream"].get_data()
+
+            # 过滤无效图片（习题册中可能存在的空白图片）
+            if len(img_data) < 100:  # 过滤极小无效数据
+                continue
+
+            img_hash = hashlib.sha1(img_data).hexdigest()
+            img_format = inspect_image(img_data)
+            if img_format is None:
+                print(f"  第 {page_num} 页图像 {img_idx+1} 数据无效，跳过")
+                error_path = os.path.join(
+                    image_dir, f"error_page_{page_num}_img_{img_idx}.bin"
+                )
+                with open(error_path, "wb") as f:
+                    f.write(img_data)
+                continue
+
+            img_name = f"{img_hash[:16]}.{img_format}"
+            img_path = os.path.join(image_dir, img_name)
+            if not os.path.exists(img_path):
+                # 多个工作进程可能同时保存同一图片，先写临时文件再原子替换
+                tmp_path = f"{img_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(img_data)
+                os.replace(tmp_path, img_path)
+
+            images.append(
+                {
+                    "name": img_name,
+                    "page": page_num,
+                    "path": img_path,
+                    "top": img.get("top", 0),
+                    "hash": img_hash,
+                }
+            )
+
+        except Exception as e:
+            print(f"保存图片时出错: {e}")
+            logging.error(f"页面 {page_num} 图像 {img_idx+1} 保存失败: {str(e)}")
+    images.sort(key=lambda image: image["top"])
+    return images
+
+
+def _extract_page_range(pdf_path, start, end, image_dir):
+    """在工作进程中打开一次 PDF，提取第 start 到 end 页（含）的文本行和图片"""
+    pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num in range(start, end + 1):
+            page = pdf.pages[page_num - 1]
+            pages.append(
+                {
+                    "page": page_num,
+                    "lines": [
+                        {"text": line["text"], "top": line["top"]}
+                        for line in page.extract_text_lines()
+                    ],
+                    "images": _save_page_images(page, page_num, image_dir),
+                }
+            )
+    return pages
+
+
+def _load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.error(f"读取页面缓存失败 {cache_path}: {str(e)}")
+        return None
+    if cached.get("version") != CACHE_VERSION:
+        return None
+    # 图片已被删除时需要重新提取
+    for page in cached["pages"]:
+        if not all(os.path.exists(img["path"]) for img in page["images"]):
+            return None
+    return cached["pages"]
+
+
+def _cache_path(pdf_path, image_dir, cache_dir):
+    """页面缓存文件路径，按 PDF 内容哈希和图片目录区分"""
+    os.makedirs(cache_dir, exist_ok=True)
+    image_key = hashlib.sha256(os.path.abspath(image_dir).encode("utf-8"))
+    return os.path.join(
+        cache_dir, f"{file_sha256(pdf_path)}_{image_key.hexdigest()[:8]}.json"
+    )
+
+
+def extract_pages(
+    pdf_path, image_dir, workers=None, cache_dir=DEFAULT_CACHE_DIR, pages_per_task=8
+):
+    """按页顺序产出 PDF 每页的文本行和图片信息
+
+    每个工作进程只打开一次 PDF，按页区间并行提取文本和图片；
+    提取结果按 PDF 内容哈希缓存到 cache_dir，重跑解析脚本时无需再次提取。
+    每页产出 {"page": 页码, "lines": [{"text", "top"}],
+    "images": [{"name", "page", "path", "top", "hash"}]}，行和图片均按纵坐标排序。
+    """
+    os.makedirs(image_dir, exist_ok=True)
+    cache_path = None
+    if cache_dir:
+        cache_path = _cache_path(pdf_path, image_dir, cache_dir)
+        cached_pages = _load_cache(cache_path)
+        if cached_pages is not None:
+            print(f"使用页面缓存 {cache_path}")
+            yield from cached_pages
+            return
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    ranges = [
+        (start, min(start + pages_per_task - 1, page_count))
+        for start in range(1, page_count + 1, pages_per_task)
+    ]
+
+    pages = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_extract_page_range, pdf_path, start, end, image_dir)
+            for start, end in ranges
+        ]
+        # 按提交顺序取结果，保证页面顺序，同时其余页区间继续并行提取
+        for future in futures:
+            for page in future.result():
+                pages.append(page)
+                yield page
+
+    image_count = sum(len(page["images"]) for page in pages)
+    print(f"共提取 {page_count} 页，{image_count} 张有效图片")
+
+    if cache_path:
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "pages": pages}, f, ensure_ascii=False)
+        os.replace(cache_path + ".tmp", cache_path)
+
+
+def page_images(pdf_path, image_dir, workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """统计每张图片出现在哪些页上，返回 {图片哈希: 页码集合}
+
+    用于在逐题解析之前找出页眉、logo 等跨页重复的图片。结果单独缓存为一个小文件，
+    再次调用时不必读取完整的页面缓存；没有缓存时完整提取一遍 PDF（同时写好页面缓存，
+    随后的 extract_pages 直接读缓存），只保留图片哈希，不保留文本行。
+    cache_dir 为空时不缓存，解析时需要再提取一次。
+    """
+    index_path = None
+    if cache_dir:
+        index_path = _cache_path(pdf_path, image_dir, cache_dir)[: -len(".json")]
+        index_path += ".images.json"
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, "r", encoding="utf-8") as f:
+                    cached = json.load(f)
+                if cached.get("version") == CACHE_VERSION:
+                    return {digest: set(pages) for digest, pages in cached["images"].items()}
+            except (OSError, ValueError) as e:
+                logging.error(f"读取图片索引失败 {index_path}: {str(e)}")
+
+    index = {}
+    for page in extract_pages(pdf_path, image_dir, workers, cache_dir):
+        for image in page["images"]:
+            index.setdefault(image["hash"], set()).add(page["page"])
+
+    if index_path:
+        with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": CACHE_VERSION,
+                    "images": {digest: sorted(pages) for digest, pages in index.items()},
+                },
+                f,
+            )
+        os.replace(index_path + ".tmp", index_path)
+    return index
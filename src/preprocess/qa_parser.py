@@ -0,0 +1,363 @@
+import json
+import logging
+import re
+
+
+class RuleSet:
+    """题库解析规则
+
+    line_pattern 将题号、选项、答案、解析、知识点等行类型合并为一个预编译正则，
+    每个分支用行类型命名（question/option/answer/analysis/knowledge），
+    分支顺序即匹配优先级；每行只需匹配一次，再按 match.lastgroup 分派到 on_<类型>。
+    """
+
+    line_pattern = None
+
+    def normalize(self, line):
+        """匹配前对行做归一化"""
+        return line
+
+    def observe(self, line, page):
+        """每行匹配前调用，用于维护章节、学科等上下文状态"""
+
+    def new_question(self, match, line, page):
+        raise NotImplementedError
+
+    def on_option(self, question, match, line):
+        pass
+
+    def on_answer(self, question, match, line):
+        pass
+
+    def on_analysis(self, question, match, line):
+        pass
+
+    def on_knowledge(self, question, match, line):
+        pass
+
+    def is_complete(self, question):
+        """判断题目是否需要输出"""
+        return True
+
+
+class QuestionParser:
+    """通用题库解析引擎：逐行匹配，边解析边以生成器形式产出题目"""
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def parse(self, records, skip_images=()):
+        """解析按阅读顺序排列的 (页码, 内容) 序列
+
+        内容为字符串时作为文本行匹配；为字典时表示图片 {"name", "hash"}，
+        关联到其前面最近的一道题，多道题共用的图片会关联到每道题。
+        skip_images 为需要忽略的图片哈希（页眉、logo 等），可用 repeated_images 统计，
+        需在解析前得到，records 仍可以是生成器；
+        第一道题之前的图片不属于任何题目，直接跳过。
+        """
+        rules = self.rules
+        match_line = rules.line_pattern.match
+        current = None
+
+        for page, item in records:
+            if not isinstance(item, str):
+                if (
+                    item["hash"] not in skip_images
+                    and current is not None
+                    and "images" in current
+                    and item["name"] not in current["images"]
+                ):
+                    current["images"].append(item["name"])
+                continue
+
+            line = rules.normalize(item)
+            rules.observe(line, page)
+            match = match_line(line)
+            if match is None:
+                continue
+
+            kind = match.lastgroup
+            if kind == "question":
+                if current is not None and rules.is_complete(current):
+                    yield current
+                current = rules.new_question(match, line, page)
+            elif current is not None:
+                getattr(rules, "on_" + kind)(current, match, line)
+
+        if current is not None and rules.is_complete(current):
+            yield current
+
+
+def image_pages(records):
+    """统计 (页码, 内容) 序列中每张图片出现在哪些页上，返回 {图片哈希: 页码集合}"""
+    pages = {}
+    for page, item in records:
+        if not isinstance(item, str):
+            pages.setdefault(item["hash"], set()).add(page)
+    return pages
+
+
+def repeated_images(pages, min_pages=3):
+    """出现在至少 min_pages 个不同页面上的图片哈希，视为页眉、logo 等版面元素
+
+    pages 为 {图片哈希: 页码集合}，由 image_pages 或 pdf_extractor.page_images 统计。
+    默认要求 3 页：跨页的两道题共用一张图时，这张图出现在相邻两页上，不应被当作页眉。
+    """
+    return {digest for digest, seen in pages.items() if len(seen) >= min_pages}
+
+
+def pdf_lines(pages):
+    """将 extract_pages 产出的页面展开为 (页码, 文本行或图片)，按纵坐标交错排列"""
+    for page in pages:
+        page_num = page["page"]
+        images = page["images"]
+        next_image = 0
+        for line in page["lines"]:
+            # 先产出位于该行之上的图片
+            while next_image < len(images) and images[next_image]["top"] < line["top"]:
+                yield page_num, images[next_image]
+                next_image += 1
+            text = line["text"].strip()
+            if text:
+                yield page_num, text
+        for image in images[next_image:]:
+            yield page_num, image
+
+
+def write_jsonl(questions, output_file):
+    """逐题写入 JSONL 文件，返回写入的题目数"""
+    count = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        for question in questions:
+            f.write(json.dumps(question, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def iter_questions(path):
+    """读取题库文件，兼容 JSON 数组、JSONL 和 .qbank 三种格式"""
+    if path.endswith(".qbank"):
+        from question_store import QuestionStore
+
+        with QuestionStore(path) as store:
+            yield from store
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def _split_knowledge_points(text):
+    return [kp.strip() for kp in text.split(",")]
+
+
+class Pdf1000Rules(RuleSet):
+    """408 1000题（答案册）PDF"""
+
+    line_pattern = re.compile(
+        r"^(?:(?P<question>(?P<qid>\d+)[.、])"
+        r"|(?P<option>(?P<opt_key>[A-E])[.\s](?P<opt_val>.+)?)"
+        r"|(?P<answer>.*?答案:\s*(?P<ans>[A-Z])?)"
+        r"|(?P<analysis>.*?【解析】\s*(?P<ana>.+)?)"
+        r"|(?P<knowledge>.*?知识点:\s*(?P<kp>.+)?))"
+    )
+    subject_category = "计算机综合"
+
+    def normalize(self, line):
+        # 处理全角转半角
+        return line.replace("．", ".").replace("：", ":")
+
+    def question_id(self, qid):
+        return f"Q{qid}"
+
+    def new_question(self, match, line, page):
+        return {
+            "question_id": self.question_id(match.group("qid")),
+            "question": line,
+            "options": {},
+            "answer": "",
+            "analysis": "",
+            "knowledge_points": [],
+            "images": [],  # 关联的图片名
+            "page": page,
+            "subject_category": self.subject_category,
+        }
+
+    def on_option(self, question, match, line):
+        if match.group("opt_val"):
+            question["options"][match.group("opt_key")] = match.group("opt_val").strip()
+
+    def on_answer(self, question, match, line):
+        if match.group("ans"):
+            question["answer"] = match.group("ans")
+
+    def on_analysis(self, question, match, line):
+        if match.group("ana"):
+            question["analysis"] += match.group("ana")
+
+    def on_knowledge(self, question, match, line):
+        if match.group("kp"):
+            question["knowledge_points"] = _split_knowledge_points(match.group("kp"))
+
+
+class Pdf26_1000Rules(Pdf1000Rules):
+    """26 版 408 1000题（题目篇）PDF，题号按 学科-章节-题号 编排"""
+
+    option_items = re.compile(r"([A-E])[.\s]+(.+?)(?=[B-E][.\s]|$)", re.DOTALL)
+
+    def __init__(self, subject_category="计算机网络", subject_category_type=4):
+        self.subject_category = subject_category
+        self.subject_category_type = subject_category_type
+        self.chapter = 0
+
+    def question_id(self, qid):
+        # 题号回到 1 表示进入下一章
+        if int(qid) == 1:
+            self.chapter += 1
+        return f"{self.subject_category_type}-{self.chapter}-{qid}"
+
+    def on_option(self, question, match, line):
+        options_matches = self.option_items.findall(line)
+        for letter, content in options_matches:
+            question["options"][letter] = content.strip()
+        if not options_matches:
+            logging.debug(
+                f"无法解析的选项行 {question['question_id']}: {line!r}, "
+                f"已有选项 {question['options']}"
+            )
+
+
+class NetworkRules(RuleSet):
+    """深入浅出计算机网络习题解答 PDF"""
+
+    line_pattern = re.compile(
+        r"^(?:(?P<question>(?P<qid>\d+)[.、])"
+        r"|(?P<option>(?P<opt_key>[A-E])[.\s](?P<opt_val>.+)?)"
+        r"|(?P<answer>.*?【答案】\s*(?P<ans>[A-Z])?)"
+        r"|(?P<analysis>.*?【解析】\s*(?P<ana>.+)?))"
+    )
+
+    def normalize(self, line):
+        return line.replace("．", ".").replace("：", ":")
+
+    def new_question(self, match, line, page):
+        return {
+            "question_id": f"N{match.group('qid')}",
+            "question": line,
+            "options": {},
+            "answer": "",
+            "analysis": "",
+            "images": [],
+            "page": page,
+            "subject_category": "计算机网络",
+        }
+
+    on_option = Pdf1000Rules.on_option
+    on_answer = Pdf1000Rules.on_answer
+
+    def on_analysis(self, question, match, line):
+        if match.group("ana"):
+            question["analysis"] += match.group("ana").strip()
+
+
+class MinerURules(RuleSet):
+    """MinerU 解析 408 1000题得到的 content_list，每条文本块作为一行"""
+
+    line_pattern = re.compile(
+        r"^(?:(?P<question>(?P<qid>\d+)\.\s*(?P<text>.*))"
+        r"|(?P<option>[A-E][.．、])"
+        r"|(?P<answer>[\s\S]*?答案：[\s\S]*)"
+        r"|(?P<analysis>[\s\S]*?【解析】\s*(?P<ana>.+)))"
+    )
+    option_items = re.compile(r"([A-E])[.．、]\s*(.*?)(?=[A-E][.．、]|$)")
+    answer_letter = re.compile(r"答案[:：]\s*([A-E])")
+    chapter_header = re.compile(r"^第\w+章\s*")
+    subjects = ("数据结构", "计算机网络", "操作系统", "计算机组成原理")
+
+    def __init__(self):
+        self.current_subject = "计算机综合"
+        self.current_knowledge = []
+
+    def observe(self, line, page):
+        # 学科标题与章节标题更新上下文
+        if line in self.subjects:
+            self.current_subject = line
+            self.current_knowledge = []
+        if self.chapter_header.match(line):
+            self.current_knowledge = [line]
+
+    def new_question(self, match, line, page):
+        return {
+            "question_id": f"Q{int(match.group('qid'))}",
+            "question": match.group("text"),
+            "options": {},
+            "answer": "",
+            "analysis": "",
+            "knowledge_points": self.current_knowledge.copy(),
+            "images": [],
+            "page": page,
+            "subject_category": self.current_subject,
+        }
+
+    def on_option(self, question, match, line):
+        for opt_key, opt_val in self.option_items.findall(line):
+            question["options"][opt_key] = opt_val.strip()
+
+    def on_answer(self, question, match, line):
+        ans_match = self.answer_letter.search(line)
+        if ans_match:
+            question["answer"] = ans_match.group(1)
+
+    def on_analysis(self, question, match, line):
+        question["analysis"] = match.group("ana")
+
+
+class Docx400Rules(RuleSet):
+    """assistant408 的 400 题 docx（unstructured 解析后的元素文本）
+
+    选项只取题号后紧邻的一个元素，答案只在题号后第 2、3 个元素中查找。
+    """
+
+    line_pattern = re.compile(
+        r"^(?:(?P<question>\d+[.、])"
+        r"|(?P<option>[A-Da-d])"
+        r"|(?P<answer>\*\*答案：))"
+    )
+    option_items = re.compile(r"([A-E])[.\s]+(.+?)(?=[B-E][.\s]|$)", re.DOTALL)
+
+    def __init__(self, subject_category="未知类型"):
+        self.subject_category = subject_category
+        self.position = 0
+        self.question_position = 0
+
+    def normalize(self, line):
+        return line.strip()
+
+    def observe(self, line, page):
+        self.position += 1
+
+    def new_question(self, match, line, page):
+        self.question_position = self.position
+        return {
+            "question": line,
+            "options": {},
+            "answer": "",
+            "subject_category": self.subject_category,
+        }
+
+    def on_option(self, question, match, line):
+        if self.position - self.question_position == 1:
+            for letter, content in self.option_items.findall(line):
+                question["options"][letter] = content.strip()
+
+    def on_answer(self, question, match, line):
+        if not question["answer"] and self.position - self.question_position in (2, 3):
+            question["answer"] = line.replace("**答案：", "").replace("**", "").strip()
+
+    def is_complete(self, question):
+        return bool(question["question"] and question["options"] and question["answer"])
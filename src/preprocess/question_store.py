@@ -0,0 +1,282 @@
+"""题库的紧凑二进制列式格式（.qbank）
+
+文件布局（小端）：
+    8 字节魔数 | 8 字节头部长度 | JSON 头部 | 各数据段（8 字节对齐）
+每个字段一列：偏移数组（uint64，count+1 个）+ 连续存放的 UTF-8 值，字符串列直接存文本，
+其他列存 JSON。另有按学科分组的行号数组（uint32）和按题号哈希排序的查找表（题号可重复，查找返回全部匹配的题目）。
+
+读取时用 mmap 打开，只解析头部；取值时直接在映射内存上按偏移解码所需字段，
+按题号、按学科访问和抽样都不需要读入整个题库。
+
+    python src/preprocess/question_store.py data/test_data/*.jsonl -o pool.qbank
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import random
+import sys
+from array import array
+
+from qa_parser import iter_questions
+
+MAGIC = b"QBANK\x00\x01\x00"
+ID_FIELD = "question_id"
+SUBJECT_FIELD = "subject_category"
+
+
+def _id_key(question_id):
+    """题号统一按字符串比较：JSON 中的整数题号 12 与字符串 "12" 视为同一题号"""
+    return str(question_id)
+
+
+def _id_hash(question_id):
+    digest = hashlib.blake2b(_id_key(question_id).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def _check_byteorder():
+    if sys.byteorder != "little":
+        raise OSError("qbank files can only be read and written on little-endian hosts")
+
+
+def write_question_store(questions, output_file):
+    """将题目写成 .qbank 文件（先写临时文件再替换），返回题目数"""
+    _check_byteorder()
+    rows = list(questions)
+    names = []
+    for question in rows:
+        for name in question:
+            if name not in names:
+                names.append(name)
+
+    sections = []
+    size = 0
+
+    def add_section(data):
+        nonlocal size
+        position = size
+        sections.append(data)
+        size += len(data)
+        padding = -size % 8
+        if padding:
+            sections.append(b"\x00" * padding)
+            size += padding
+        return position
+
+    columns = []
+    for name in names:
+        values = [question.get(name) for question in rows]
+        encoding = "str" if all(isinstance(v, str) for v in values) else "json"
+        offsets = array("Q", [0])
+        data = bytearray()
+        for value in values:
+            if encoding == "str":
+                data += value.encode("utf-8")
+            else:
+                data += json.dumps(value, ensure_ascii=False).encode("utf-8")
+            offsets.append(len(data))
+        columns.append(
+            {
+                "name": name,
+                "encoding": encoding,
+                "offsets": add_section(offsets.tobytes()),
+                "data": add_section(bytes(data)),
+            }
+        )
+
+    subjects = {}
+    for row, question in enumerate(rows):
+        subjects.setdefault(str(question.get(SUBJECT_FIELD, "")), array("I")).append(row)
+    subject_index = {
+        subject: [add_section(row_ids.tobytes()), len(row_ids)]
+        for subject, row_ids in subjects.items()
+    }
+
+    id_index = None
+    if ID_FIELD in names:
+        pairs = sorted(
+            (_id_hash(question[ID_FIELD]), row)
+            for row, question in enumerate(rows)
+            if question.get(ID_FIELD) is not None
+        )
+        id_index = {
+            "count": len(pairs),
+            "hashes": add_section(array("Q", [h for h, _ in pairs]).tobytes()),
+            "rows": add_section(array("I", [row for _, row in pairs]).tobytes()),
+        }
+
+    header = json.dumps(
+        {
+            "count": len(rows),
+            "columns": columns,
+            "subjects": subject_index,
+            "ids": id_index,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    header += b" " * (-len(header) % 8)
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    with open(output_file + ".tmp", "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for data in sections:
+            f.write(data)
+    os.replace(output_file + ".tmp", output_file)
+    return len(rows)
+
+
+class QuestionStore:
+    """只读打开 .qbank 文件，按行号、题号、学科随机访问，只解码需要的字段"""
+
+    def __init__(self, path):
+        _check_byteorder()
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        if self._buffer[:8] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a qbank file")
+        header_len = int.from_bytes(self._buffer[8:16], "little")
+        header = json.loads(str(self._buffer[16 : 16 + header_len], "utf-8"))
+        self._base = 16 + header_len
+        self.count = header["count"]
+        self._columns = {}
+        for column in header["columns"]:
+            offsets = self._array(column["offsets"], self.count + 1, "Q")
+            self._columns[column["name"]] = (
+                column["encoding"],
+                offsets,
+                self._base + column["data"],
+            )
+        self.fields = tuple(self._columns)
+        self._subjects = header["subjects"]
+        self._ids = header["ids"]
+
+    def _array(self, position, length, typecode):
+        """映射内存上的定长数组视图，不复制数据"""
+        itemsize = array(typecode).itemsize
+        start = self._base + position
+        return self._buffer[start : start + length * itemsize].cast(typecode)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._columns = {}
+        try:
+            self._buffer.release()
+            self._mmap.close()
+        except BufferError:
+            # 调用方仍持有 rows_by_subject 返回的视图，映射随其一起回收
+            pass
+        self._file.close()
+
+    def value(self, row, field):
+        encoding, offsets, data = self._columns[field]
+        raw = self._buffer[data + offsets[row] : data + offsets[row + 1]]
+        if encoding == "str":
+            return str(raw, "utf-8")
+        return json.loads(str(raw, "utf-8"))
+
+    def get(self, row, fields=None):
+        """第 row 道题，fields 指定只解码的字段；值为 null 的字段（原题缺失）不返回"""
+        if not 0 <= row < self.count:
+            raise IndexError(f"row {row} out of range")
+        question = {}
+        for field in fields or self.fields:
+            if field in self._columns:
+                value = self.value(row, field)
+                if value is not None:
+                    question[field] = value
+        return question
+
+    def __getitem__(self, row):
+        return self.get(row)
+
+    def __iter__(self):
+        return self.select(range(self.count))
+
+    def select(self, rows, fields=None):
+        """按行号依次产出题目"""
+        for row in rows:
+            yield self.get(row, fields)
+
+    def find_rows(self, question_id):
+        """题号对应的全部行号（按行号升序），不存在时返回空列表
+
+        题号不保证唯一：合并多个题库文件时，各文件、各章节的题号会重复（如每章都从 Q1 开始），
+        因此返回所有匹配的行，由调用方按学科、题干等字段区分。
+        """
+        if not self._ids:
+            return []
+        count = self._ids["count"]
+        hashes = self._array(self._ids["hashes"], count, "Q")
+        rows = self._array(self._ids["rows"], count, "I")
+        target = _id_hash(question_id)
+        low, high = 0, count
+        while low < high:
+            mid = (low + high) // 2
+            if hashes[mid] < target:
+                low = mid + 1
+            else:
+                high = mid
+        # 哈希相同的题号逐个核对（两边按同样方式归一化），表内同一哈希的行号已升序排列
+        key = _id_key(question_id)
+        matches = []
+        while low < count and hashes[low] == target:
+            if _id_key(self.value(rows[low], ID_FIELD)) == key:
+                matches.append(rows[low])
+            low += 1
+        return matches
+
+    def find(self, question_id, fields=None):
+        """按题号取题，返回全部同题号的题目列表（可能有多道，见 find_rows），不存在时为空列表"""
+        return list(self.select(self.find_rows(question_id), fields))
+
+    def subjects(self):
+        """{学科: 题目数}"""
+        return {subject: count for subject, (_, count) in self._subjects.items()}
+
+    def rows_by_subject(self, subject):
+        """学科下全部题目的行号（映射内存上的 uint32 视图）"""
+        if subject not in self._subjects:
+            return memoryview(array("I"))
+        position, count = self._subjects[subject]
+        return self._array(position, count, "I")
+
+    def sample(self, n, seed=None, subject=None, fields=None):
+        """随机抽取 n 道题（不放回），subject 限定学科；只解码被抽中的题目"""
+        rows = range(self.count) if subject is None else self.rows_by_subject(subject)
+        picked = random.Random(seed).sample(range(len(rows)), min(n, len(rows)))
+        return list(self.select((rows[i] for i in picked), fields))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将 JSON/JSONL 题库转换为 .qbank")
+    parser.add_argument("inputs", nargs="+", help="JSON 或 JSONL 题库文件")
+    parser.add_argument("-o", "--output", required=True, help="输出 .qbank 文件")
+    args = parser.parse_args()
+
+    questions = (q for path in args.inputs for q in iter_questions(path))
+    count = write_question_store(questions, args.output)
+    with QuestionStore(args.output) as store:
+        subjects = store.subjects()
+    print(f"共 {count} 道题写入 {args.output}，{os.path.getsize(args.output)} 字节")
+    for subject, number in sorted(subjects.items()):
+        print(f"  {subject or '未分类'}: {number}")
+
+
+if __name__ == "__main__":
+    main()
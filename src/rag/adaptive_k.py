@@ -0,0 +1,34 @@
+"""自适应检索数量：按检索分数的分布决定放入提示词的文档块数
+
+检索时先多取一些候选（默认 2k 个），再保留与第一名分数的相对差距不超过 band 的文档块：
+第一名明显领先时只保留它，分数接近时保留更多，最少 min_k 个、最多全部候选。
+分数由 VectorDatabase 写入 metadata["score"]（越大越相关）：稠密检索为内积相似度，
+混合检索为 WeightedRanker 的融合分数，两者量纲不同，因此按第一名分数归一化后再比较，
+同一个 band 对两种检索模式都适用。
+"""
+
+# 相对差距：稠密检索第一名的内积通常在 0.6~0.8，0.07 约相当于 0.05 的绝对差距
+DEFAULT_BAND = 0.07
+
+
+def candidate_count(k):
+    """自适应模式下检索的候选数量"""
+    return max(2 * k, 1)
+
+
+def choose_k(scores, min_k=1, band=DEFAULT_BAND):
+    """按降序分数返回应保留的数量，分数先除以第一名分数的绝对值"""
+    if not scores:
+        return 0
+    top = scores[0]
+    scale = abs(top) or 1.0
+    keep = sum(1 for score in scores if (top - score) / scale <= band)
+    return min(len(scores), max(min_k, keep))
+
+
+def select(docs, min_k=1, band=DEFAULT_BAND):
+    """截取文档块；缺少分数时（如旧版本返回的结果）原样返回"""
+    scores = [doc.metadata.get("score") for doc in docs]
+    if any(score is None for score in scores):
+        return docs
+    return docs[: choose_k(scores, min_k, band)]
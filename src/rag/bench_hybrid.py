@@ -0,0 +1,168 @@
+"""混合检索基准：比较纯稠密检索和稠密 + 稀疏混合检索的延迟和召回率
+
+查询从知识库文档块中随机截取一段文本（可加入字符扰动），正确答案即来源文档块，
+统计 recall@k、MRR 和检索延迟分位数。知识库需以 sparse=True 构建。
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from bench_ingest import generate_corpus
+from chunk_store import INDEX_FILE, ChunkStore
+
+QUANTILES = (50, 95, 99)
+
+
+def make_queries(store, count, query_chars=40, noise=0.1, seed=0):
+    """从文档块中截取查询文本，返回 [(查询, 来源块编号)]"""
+    rng = random.Random(seed)
+    queries = []
+    ids = list(range(len(store)))
+    for chunk_id in rng.sample(ids, min(count, len(ids))):
+        text = store.get(chunk_id)["text"]
+        start = rng.randrange(max(1, len(text) - query_chars))
+        chars = list(text[start : start + query_chars])
+        # 随机删掉一部分字符，模拟提问和原文表述不完全一致
+        chars = [c for c in chars if rng.random() >= noise]
+        queries.append(("".join(chars), chunk_id))
+    return queries
+
+
+def evaluate(search, queries, k):
+    """运行一组查询，返回召回率、MRR 和延迟分位数（毫秒）"""
+    latencies = []
+    hits = 0
+    reciprocal_ranks = 0.0
+    for query, chunk_id in queries:
+        start = time.perf_counter()
+        docs = search(query, k)
+        latencies.append(time.perf_counter() - start)
+        ranked = [doc.metadata.get("chunk_id") for doc in docs]
+        if chunk_id in ranked:
+            hits += 1
+            reciprocal_ranks += 1 / (ranked.index(chunk_id) + 1)
+    latencies.sort()
+    return {
+        f"recall@{k}": round(hits / len(queries), 4),
+        "mrr": round(reciprocal_ranks / len(queries), 4),
+        "latency_ms": {
+            f"p{q}": round(
+                latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+                * 1000,
+                3,
+            )
+            for q in QUANTILES
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="混合检索基准")
+    parser.add_argument("--persist-dir", help="已用 --sparse 构建的向量数据库")
+    parser.add_argument(
+        "--chunks-dir",
+        help="与数据库对应的文档块目录，默认使用版本清单中上线版本的文档块目录",
+    )
+    parser.add_argument(
+        "--embedding",
+        default="hashing",
+        choices=["openai", "onnx", "hashing"],
+        help="向量化后端，需与构建知识库时一致",
+    )
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-chars", type=int, default=40)
+    parser.add_argument("--noise", type=float, default=0.1, help="查询中删除字符的比例")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--sparse-weight", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    from embedding_apis import create_embedding
+    from rag_main import RAGSystem
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    embedding = create_embedding(args.embedding)
+
+    with tempfile.TemporaryDirectory(prefix="bench_hybrid_") as work_dir:
+        if args.persist_dir:
+            persist_dir, chunks_dir = args.persist_dir, args.chunks_dir
+        else:
+            # 未指定知识库时用合成语料构建一个带稀疏向量的知识库
+            persist_dir, chunks_dir = os.path.join(work_dir, "db", "bench.db"), None
+            os.makedirs(os.path.dirname(persist_dir), exist_ok=True)
+            corpus_dir = os.path.join(work_dir, "corpus")
+            generate_corpus(
+                corpus_dir, num_docs=5, chars_per_doc=20000, seed=args.seed
+            )
+            RAGSystem(
+                persist_dir=persist_dir,
+                strategy="chapter",
+                output_dir=os.path.join(work_dir, "chunks"),
+                embedding=embedding,
+                sparse=True,
+            ).build_knowledge_base(corpus_dir, force=True)
+
+        rag_system = RAGSystem(persist_dir=persist_dir, embedding=embedding)
+        collection = rag_system.registry.resolve(rag_system.alias)
+        # 未指定 --chunks-dir 时使用上线版本的文档块
+        chunks_dir = chunks_dir or rag_system.chunks_dir(collection)
+        if not os.path.exists(os.path.join(chunks_dir, INDEX_FILE)):
+            parser.error(f"{chunks_dir} 下没有文档块，请指定 --chunks-dir")
+        store = ChunkStore(chunks_dir)
+        queries = make_queries(
+            store, args.queries, args.query_chars, args.noise, args.seed
+        )
+        vector_db = rag_system.vector_db
+        vector_db.load_existing(persist_dir)
+        if not vector_db.has_sparse(collection):
+            parser.error("知识库不含稀疏向量，请使用 --sparse 重新构建")
+
+        def dense(query, k):
+            return vector_db.similarity_search(query, k=k, collection_name=collection)
+
+        def hybrid(query, k):
+            return vector_db.hybrid_search(
+                query,
+                k=k,
+                collection_name=collection,
+                sparse_weight=args.sparse_weight,
+            )
+
+        # 预热
+        dense(queries[0][0], args.k)
+        hybrid(queries[0][0], args.k)
+
+        result = {
+            "config": {
+                "embedding": args.embedding,
+                "queries": len(queries),
+                "query_chars": args.query_chars,
+                "noise": args.noise,
+                "k": args.k,
+                "sparse_weight": args.sparse_weight,
+            },
+            "dense": evaluate(dense, queries, args.k),
+            "hybrid": evaluate(hybrid, queries, args.k),
+        }
+
+    for mode in ("dense", "hybrid"):
+        stats = result[mode]
+        print(
+            f"{mode:<8} recall@{args.k} {stats[f'recall@{args.k}']:.3f}  "
+            f"MRR {stats['mrr']:.3f}  latency {stats['latency_ms']}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
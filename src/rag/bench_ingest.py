@@ -0,0 +1,245 @@
+"""知识库构建基准：合成教材语料 + 本地模拟向量服务，测量各阶段吞吐和峰值内存"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import telemetry
+from fake_openai_server import FakeOpenAIServer
+
+# 合成语料用的 408 科目和术语
+SUBJECTS = {
+    "数据结构": [
+        "线性表", "栈", "队列", "二叉树", "图", "散列表", "B树", "快速排序", "堆排序"
+    ],
+    "计算机组成原理": [
+        "指令系统", "Cache", "主存储器", "总线", "流水线", "中断", "浮点数", "微程序"
+    ],
+    "操作系统": [
+        "进程", "线程", "死锁", "信号量", "页表", "虚拟内存", "文件系统", "磁盘调度"
+    ],
+    "计算机网络": [
+        "TCP", "UDP", "IP地址", "路由算法", "滑动窗口", "拥塞控制", "DNS", "以太网"
+    ],
+}
+SENTENCES = (
+    "{a}是{subject}中的重要概念，它与{b}密切相关。",
+    "在实际系统中，{a}通常用于解决{b}带来的性能问题。",
+    "理解{a}的关键在于掌握其基本原理和典型应用场景。",
+    "{a}的时间开销主要取决于{b}的组织方式。",
+    "考研真题中经常考查{a}与{b}之间的区别和联系。",
+    "例如，当{b}发生变化时，{a}需要相应地进行调整。",
+)
+CHARS_PER_PAGE = 1200
+
+
+def _paragraph(rng, subject, terms, sentences=5):
+    sentences_text = []
+    for _ in range(sentences):
+        a, b = rng.sample(terms, 2)
+        sentences_text.append(rng.choice(SENTENCES).format(subject=subject, a=a, b=b))
+    return "".join(sentences_text)
+
+
+def generate_text(rng, chars):
+    """生成约 chars 个字符的章节结构教材文本"""
+    subject = rng.choice(list(SUBJECTS))
+    terms = SUBJECTS[subject]
+    lines = []
+    size = 0
+    chapter = 0
+    while size < chars:
+        chapter += 1
+        lines.append(f"第{chapter}章 {subject}之{rng.choice(terms)}")
+        for section in range(1, rng.randint(3, 6)):
+            lines.append(f"{chapter}.{section} {rng.choice(terms)}")
+            for _ in range(rng.randint(2, 4)):
+                paragraph = _paragraph(rng, subject, terms)
+                lines.append(paragraph)
+                size += len(paragraph)
+    return "\n".join(lines)
+
+
+def _write_pdf(path, text):
+    import fitz
+
+    doc = fitz.open()
+    for start in range(0, len(text), CHARS_PER_PAGE):
+        page = doc.new_page()
+        page.insert_textbox(
+            page.rect + (50, 50, -50, -50),
+            text[start : start + CHARS_PER_PAGE],
+            fontname="china-s",
+            fontsize=10,
+        )
+    doc.save(path)
+    doc.close()
+
+
+def generate_corpus(output_dir, num_docs=10, chars_per_doc=50000, fmt="md", seed=0):
+    """生成合成语料，返回文件路径列表；fmt 为 md 或 pdf（需要 PyMuPDF）"""
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(num_docs):
+        text = generate_text(rng, chars_per_doc)
+        path = os.path.join(output_dir, f"textbook_{i:04d}.{fmt}")
+        if fmt == "pdf":
+            _write_pdf(path, text)
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB），不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(
+    corpus_dir,
+    work_dir,
+    base_url,
+    strategy="chapter",
+    chunk_size=500,
+    batch_size=64,
+    concurrency=1,
+    embedding="openai",
+):
+    """在 work_dir 中构建知识库，返回吞吐、峰值内存和各阶段耗时"""
+    from embedding_apis import create_embedding
+    from rag_main import RAGSystem, list_files
+
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    persist_dir = os.path.join(work_dir, "db", "bench.db")
+    os.makedirs(os.path.dirname(persist_dir), exist_ok=True)
+
+    telemetry.reset()
+    rag_system = RAGSystem(
+        persist_dir=persist_dir,
+        strategy=strategy,
+        chunk_size=chunk_size,
+        output_dir=os.path.join(work_dir, "chunks"),
+        embedding=create_embedding(
+            embedding, batch_size=batch_size, max_workers=concurrency
+        ),
+    )
+    start = time.perf_counter()
+    rag_system.build_knowledge_base(corpus_dir, force=True)
+    elapsed = time.perf_counter() - start
+
+    timings = telemetry.stage_timings()
+    counters = telemetry.counters()
+    files = len(list_files(corpus_dir))
+    chunks = counters.get(("embed", "chunks"), 0)
+    embed_seconds = timings.get("embed", (0, 0.0))[1]
+    return {
+        "files": files,
+        "pages": counters.get(("load", "documents"), 0),
+        "chunks": chunks,
+        "seconds": elapsed,
+        "docs_per_sec": files / elapsed,
+        "chunks_per_sec": chunks / elapsed,
+        "embeddings_per_sec": chunks / embed_seconds if embed_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {name: total for name, (_, total) in timings.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="知识库构建基准")
+    parser.add_argument("--docs", type=int, default=10, help="合成文档数")
+    parser.add_argument("--chars", type=int, default=50000, help="每篇文档的字符数")
+    parser.add_argument("--format", default="md", choices=["md", "pdf"])
+    parser.add_argument("--corpus-dir", help="使用已有语料目录，不再合成")
+    parser.add_argument(
+        "--strategy", default="chapter", choices=["default", "paper", "chapter"]
+    )
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--embedding",
+        default="openai",
+        choices=["openai", "onnx", "hashing"],
+        help="向量化后端，onnx/hashing 在本地计算，不经过向量服务",
+    )
+    parser.add_argument("--upstream", help="使用外部向量服务，不启动内置模拟服务")
+    parser.add_argument(
+        "--latency-ms", type=float, default=20.0, help="模拟服务每批基础延迟"
+    )
+    parser.add_argument(
+        "--per-text-ms", type=float, default=0.5, help="模拟服务每条文本延迟"
+    )
+    parser.add_argument("--rate-limit", type=float, help="模拟服务每秒请求数上限")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench_ingest_") as work_dir:
+        corpus_dir = args.corpus_dir or os.path.join(work_dir, "corpus")
+        if not args.corpus_dir:
+            generate_corpus(corpus_dir, args.docs, args.chars, args.format)
+
+        server = None
+        if not args.upstream:
+            server = FakeOpenAIServer(
+                embed_latency_ms=args.latency_ms,
+                per_text_ms=args.per_text_ms,
+                rate_limit=args.rate_limit,
+            ).start()
+        try:
+            result = run_benchmark(
+                corpus_dir,
+                work_dir,
+                args.upstream or server.base_url,
+                strategy=args.strategy,
+                chunk_size=args.chunk_size,
+                batch_size=args.batch_size,
+                concurrency=args.concurrency,
+                embedding=args.embedding,
+            )
+            if server is not None:
+                result["upstream"] = dict(server.stats)
+        finally:
+            if server is not None:
+                server.stop()
+
+    print(
+        f"文档 {result['files']} 个，页 {result['pages']} 个，"
+        f"文档块 {result['chunks']} 个"
+    )
+    print(f"总耗时 {result['seconds']:.2f} s")
+    print(
+        f"docs/sec {result['docs_per_sec']:.2f}  "
+        f"chunks/sec {result['chunks_per_sec']:.1f}"
+    )
+    if result["embeddings_per_sec"]:
+        print(f"embeddings/sec {result['embeddings_per_sec']:.1f}")
+    if result["peak_rss_mb"] is not None:
+        print(f"峰值内存 {result['peak_rss_mb']:.1f} MB")
+    print("各阶段耗时:")
+    for name, total in sorted(result["stages"].items(), key=lambda item: -item[1]):
+        print(f"  {name:<16}{total:>10.3f} s")
+    if "upstream" in result:
+        print(f"模拟服务请求: {result['upstream']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""构建知识库的内存基准：对比 langchain Document 表示和紧凑 Chunk 表示的峰值内存
+
+每种表示在一个全新子进程中依次执行 切割 -> 向量化 -> 生成插入行，以进程峰值常驻内存衡量：
+    corpus     只构造页面，作为基线
+    documents  split_documents 为每个块复制页面元数据，向量为 Python float 列表，
+               插入行（含序列化后的元数据）一次性全部生成
+    records    split_records 只引用页面元数据，向量填入预分配的 float32 矩阵，插入行逐批生成
+
+语料为合成教材文本，按页构造带 PDF 加载器典型元数据的 Document；向量使用 hashing 后端，
+不需要模型和网络。
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from bench_ingest import CHARS_PER_PAGE, generate_text, peak_rss_mb
+
+MODES = ("corpus", "documents", "records")
+INSERT_BATCH = 100
+
+
+def make_pages(num_docs, chars_per_doc, seed=0):
+    """合成语料的页面列表，元数据字段与 PyMuPDFLoader 的输出一致"""
+    from langchain.docstore.document import Document
+
+    rng = random.Random(seed)
+    pages = []
+    for i in range(num_docs):
+        text = generate_text(rng, chars_per_doc)
+        path = f"data/textbook_{i:04d}.pdf"
+        total = -(-len(text) // CHARS_PER_PAGE)
+        for page in range(total):
+            start = page * CHARS_PER_PAGE
+            metadata = {
+                "source": path,
+                "file_path": path,
+                "page": page,
+                "total_pages": total,
+                "format": "PDF 1.7",
+                "title": f"textbook_{i:04d}",
+                "author": "",
+                "subject": "",
+                "keywords": "",
+                "creator": "",
+                "producer": "PyMuPDF",
+                "creationDate": "D:20240101000000+08'00'",
+                "modDate": "D:20240101000000+08'00'",
+                "trapped": "",
+            }
+            pages.append(
+                Document(
+                    page_content=text[start : start + CHARS_PER_PAGE], metadata=metadata
+                )
+            )
+    return pages
+
+
+def run_mode(mode, num_docs, chars_per_doc, chunk_size, dim, seed=0):
+    """在当前进程中运行一种表示，返回块数、耗时和峰值内存"""
+    from document_processor import ChapterTitleSplitter
+    from embedding_apis import HashingEmbedding
+
+    pages = make_pages(num_docs, chars_per_doc, seed)
+    splitter = ChapterTitleSplitter(chunk_size=chunk_size, chunk_overlap=50)
+    embedding = HashingEmbedding(dim=dim)
+    start = time.perf_counter()
+    chunks = 0
+    if mode == "documents":
+        docs = splitter.split_documents(pages)
+        embeddings = embedding.embed_documents([doc.page_content for doc in docs])
+        rows = [
+            {
+                "text": doc.page_content,
+                "embedding": embeddings[i],
+                "metadata": json.dumps(doc.metadata, ensure_ascii=False),
+            }
+            for i, doc in enumerate(docs)
+        ]
+        chunks = len(rows)
+    elif mode == "records":
+        docs = splitter.split_records(pages)
+        embeddings = embedding.embed_array([doc.page_content for doc in docs])
+        for batch_start in range(0, len(docs), INSERT_BATCH):
+            rows = [
+                {
+                    "text": docs[i].page_content,
+                    "embedding": embeddings[i].tolist(),
+                    "metadata": json.dumps(docs[i].metadata, ensure_ascii=False),
+                }
+                for i in range(batch_start, min(batch_start + INSERT_BATCH, len(docs)))
+            ]
+        chunks = len(docs)
+    return {
+        "mode": mode,
+        "pages": len(pages),
+        "chunks": chunks,
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure(mode, args):
+    """在全新子进程中运行一种表示，避免前一种表示的内存峰值影响结果"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--mode",
+            mode,
+            "--docs",
+            str(args.docs),
+            "--chars",
+            str(args.chars),
+            "--chunk-size",
+            str(args.chunk_size),
+            "--dim",
+            str(args.dim),
+            "--seed",
+            str(args.seed),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="构建知识库内存基准")
+    parser.add_argument("--docs", type=int, default=20, help="合成文档数")
+    parser.add_argument("--chars", type=int, default=100000, help="每篇文档的字符数")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=1024, help="向量维度")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=MODES, help="只在当前进程运行一种表示")
+    parser.add_argument("--output", default="bench_memory.json")
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        result = run_mode(
+            args.mode, args.docs, args.chars, args.chunk_size, args.dim, args.seed
+        )
+        print(json.dumps(result))
+        return
+
+    results = {mode: measure(mode, args) for mode in MODES}
+    baseline = results["corpus"]["peak_rss_mb"]
+    for mode in ("documents", "records"):
+        stats = results[mode]
+        if baseline is not None and stats["peak_rss_mb"] is not None:
+            stats["ingest_rss_mb"] = round(stats["peak_rss_mb"] - baseline, 1)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {"config": vars(args), "results": results},
+            f,
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+        )
+        f.write("\n")
+
+    print(
+        f"{results['corpus']['pages']} 页，{results['records']['chunks']} 个文档块，"
+        f"向量维度 {args.dim}"
+    )
+    if baseline is None:
+        print("当前平台无法读取峰值内存")
+        return
+    for mode, stats in results.items():
+        extra = stats.get("ingest_rss_mb")
+        delta = f"  (基线之上 {extra:.1f} MB)" if extra is not None else ""
+        print(f"{mode:<10} 峰值内存 {stats['peak_rss_mb']:.1f} MB{delta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""前缀缓存基准：测量开启/关闭服务端前缀缓存时 LLM 请求的首字延迟（TTFT）
+
+请求由 LLMClient 按正式的提示词布局构造：固定的系统提示词在前，背景知识块和问题在后。
+背景知识从合成文档块池中按热度抽取（热门块被多个问题共用），默认按块编号排列，
+--order ranked 时按随机的"相似度"顺序排列，用于对比规范顺序对缓存命中的影响。
+
+默认使用本地模拟服务，依次以关闭和开启前缀缓存运行同一负载；--upstream 指定外部服务
+（如 vLLM）时只运行一次，由 --label 标记服务端是否启用了 --enable-prefix-caching。
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import time
+
+from bench_ingest import generate_text
+from bench_query import DEFAULT_QUESTIONS, _percentiles, load_workload
+from fake_openai_server import FakeOpenAIServer
+
+
+def make_requests(questions, count, pool_size, chunk_chars, k, order, seed=0):
+    """生成 [(问题, 背景知识列表)]；块被选中的概率与其编号成反比"""
+    rng = random.Random(seed)
+    pool = [generate_text(rng, chunk_chars)[:chunk_chars] for _ in range(pool_size)]
+    weights = [1 / (i + 1) for i in range(pool_size)]
+    requests = []
+    for i in range(count):
+        ids = set()
+        while len(ids) < min(k, pool_size):
+            ids.update(rng.choices(range(pool_size), weights, k=k - len(ids)))
+        ids = sorted(ids)
+        if order == "ranked":
+            rng.shuffle(ids)
+        requests.append((questions[i % len(questions)], [pool[j] for j in ids]))
+    return requests
+
+
+def measure(llm_client, requests):
+    """逐个发送流式请求，返回每个请求的首字延迟（秒）"""
+    ttfts = []
+    for question, context in requests:
+        start = time.perf_counter()
+        first = None
+        for _ in llm_client.stream_answer(question, context):
+            if first is None:
+                first = time.perf_counter() - start
+        ttfts.append(first if first is not None else time.perf_counter() - start)
+    return ttfts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="前缀缓存首字延迟基准")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="题库文件 glob")
+    parser.add_argument("--pool", type=int, default=30, help="背景知识块池大小")
+    parser.add_argument("--chunk-chars", type=int, default=500)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument(
+        "--order",
+        choices=["canonical", "ranked"],
+        default="canonical",
+        help="背景知识按块编号排列/按相似度排列",
+    )
+    parser.add_argument("--upstream", help="外部服务地址，不启动内置模拟服务")
+    parser.add_argument(
+        "--label", default="external", help="外部服务的结果标签，如 on/off"
+    )
+    parser.add_argument("--chat-latency-ms", type=float, default=20.0)
+    parser.add_argument(
+        "--prefill-ms-per-kchar",
+        type=float,
+        default=40.0,
+        help="模拟服务每千字符提示词的 prefill 时间",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_prefix_cache.json")
+    args = parser.parse_args(argv)
+
+    # 没有题库文件时使用占位问题，问题只影响提示词末尾
+    questions = load_workload(args.questions, seed=args.seed) or [
+        f"问题 {i}" for i in range(50)
+    ]
+    requests = make_requests(
+        questions,
+        args.requests,
+        args.pool,
+        args.chunk_chars,
+        args.k,
+        args.order,
+        args.seed,
+    )
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    server = None
+    if not args.upstream:
+        server = FakeOpenAIServer(
+            chat_latency_ms=args.chat_latency_ms,
+            stream_chunk_ms=0,
+            prefill_ms_per_kchar=args.prefill_ms_per_kchar,
+            answer="B",
+            seed=args.seed,
+        ).start()
+    os.environ["OPENAI_BASE_URL"] = args.upstream or server.base_url
+
+    from llm_apis import LLMClient
+
+    llm_client = LLMClient()
+    results = {}
+    try:
+        if server is None:
+            ttfts = measure(llm_client, requests)
+            results[args.label] = {"ttft_ms": _percentiles(ttfts)}
+        else:
+            for label, enabled in (("off", False), ("on", True)):
+                server.prefix_cache = enabled
+                server.reset_prefix_cache()
+                before = dict(server.stats)
+                ttfts = measure(llm_client, requests)
+                prompt_chars = server.stats["prompt_chars"] - before["prompt_chars"]
+                cached = (
+                    server.stats["cached_prompt_chars"] - before["cached_prompt_chars"]
+                )
+                results[label] = {
+                    "ttft_ms": _percentiles(ttfts),
+                    "cached_prompt_ratio": round(cached / max(prompt_chars, 1), 4),
+                }
+    finally:
+        if server is not None:
+            server.stop()
+
+    result = {
+        "config": {
+            "requests": len(requests),
+            "pool": args.pool,
+            "chunk_chars": args.chunk_chars,
+            "k": args.k,
+            "order": args.order,
+            "upstream": args.upstream or "fake",
+            "prefill_ms_per_kchar": None if args.upstream else args.prefill_ms_per_kchar,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+    for label, stats in results.items():
+        ratio = stats.get("cached_prompt_ratio")
+        cached = f"  缓存命中 {ratio:.1%}" if ratio is not None else ""
+        print(f"前缀缓存 {label:<8} TTFT (ms): {stats['ttft_ms']}{cached}")
+
+
+if __name__ == "__main__":
+    main()
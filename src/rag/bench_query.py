@@ -0,0 +1,277 @@
+"""查询负载基准：以题库题目为负载，按固定 QPS 或固定并发驱动 RAGSystem.query
+
+向量服务和 LLM 默认由本地模拟服务提供（对数正态延迟），结果写成便于 diff 的 JSON。
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from bench_ingest import generate_corpus
+from fake_openai_server import FakeOpenAIServer
+from question_bank import load_questions
+
+PROJECT_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+DEFAULT_QUESTIONS = os.path.join(PROJECT_DIR, "data/test_data/*.json*")
+# 报告中统计分位数的阶段
+STAGES = ("query", "embed_query", "search", "generate")
+QUANTILES = (50, 95, 99)
+
+
+def load_workload(pattern, limit=None, seed=0):
+    """读取题库题干作为查询负载，打乱顺序"""
+    questions = []
+    for path in sorted(glob.glob(pattern)):
+        questions.extend(
+            item["question"] for item in load_questions(path, fields=("question",))
+        )
+    random.Random(seed).shuffle(questions)
+    return questions[:limit] if limit else questions
+
+
+def _percentiles(values):
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{q}": 0.0 for q in QUANTILES}
+    result = {}
+    for q in QUANTILES:
+        value = ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+        result[f"p{q}"] = round(value * 1000, 3)
+    return result
+
+
+class LoadGenerator:
+    """记录每个请求的端到端延迟和错误类型"""
+
+    def __init__(self, rag_system, questions, k=3, adaptive=False):
+        self.rag_system = rag_system
+        self.questions = questions
+        self.k = k
+        self.adaptive = adaptive
+        self.latencies = []
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def _request(self, question, scheduled):
+        try:
+            self.rag_system.query(question, k=self.k, adaptive=self.adaptive)
+        except Exception as e:
+            with self.lock:
+                name = type(e).__name__
+                self.errors[name] = self.errors.get(name, 0) + 1
+            return
+        # 固定 QPS 模式从计划发出时间算起，包含排队时间
+        with self.lock:
+            self.latencies.append(time.perf_counter() - scheduled)
+
+    def run_qps(self, qps, duration, max_workers=256):
+        """开环：按固定速率发出请求，不等待前一个请求完成"""
+        total = int(qps * duration)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for i in range(total):
+                scheduled = start + i / qps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                question = self.questions[i % len(self.questions)]
+                pool.submit(self._request, question, scheduled)
+        return total, time.perf_counter() - start
+
+    def run_concurrency(self, concurrency, duration):
+        """闭环：concurrency 个工作线程各自连续发请求，持续 duration 秒"""
+        counter = iter(range(1 << 62))
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            while time.perf_counter() < deadline:
+                with lock:
+                    i = next(counter)
+                question = self.questions[i % len(self.questions)]
+                self._request(question, time.perf_counter())
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return next(counter), time.perf_counter() - start
+
+    def report(self, sent, elapsed):
+        failed = sum(self.errors.values())
+        counters = telemetry.counters()
+        succeeded = max(len(self.latencies), 1)
+        return {
+            "requests": sent,
+            "succeeded": len(self.latencies),
+            "failed": failed,
+            "error_rate": round(failed / sent, 4) if sent else 0.0,
+            "errors": dict(sorted(self.errors.items())),
+            "throughput_qps": round(len(self.latencies) / elapsed, 3),
+            "latency_ms": _percentiles(self.latencies),
+            # 每个请求平均放入提示词的文档块数和提示词 token 数
+            "chunks_per_request": round(
+                counters.get(("query", "chunks"), 0) / succeeded, 3
+            ),
+            "prompt_tokens_per_request": round(
+                counters.get(("generate", "prompt_tokens"), 0) / succeeded, 1
+            ),
+            "answer_cache_hits": counters.get(("answer_cache", "hits"), 0),
+            "exact_matches": counters.get(("query", "exact_matches"), 0),
+            "stages_ms": {
+                name: {
+                    f"p{q}": round(value * 1000, 3)
+                    for q, value in telemetry.stage_percentiles(name, QUANTILES).items()
+                }
+                for name in STAGES
+            },
+        }
+
+
+def _build_index(work_dir):
+    """用合成语料在模拟服务上构建一个小知识库，返回数据库路径"""
+    from embedding_apis import OpenAIEmbedding
+    from rag_main import RAGSystem
+
+    persist_dir = os.path.join(work_dir, "db", "bench.db")
+    os.makedirs(os.path.dirname(persist_dir), exist_ok=True)
+    corpus_dir = os.path.join(work_dir, "corpus")
+    generate_corpus(corpus_dir, num_docs=5, chars_per_doc=20000)
+    RAGSystem(
+        persist_dir=persist_dir,
+        strategy="chapter",
+        output_dir=os.path.join(work_dir, "chunks"),
+        embedding=OpenAIEmbedding(),
+    ).build_knowledge_base(corpus_dir, force=True)
+    return persist_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询负载基准")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--qps", type=float, help="固定 QPS（开环）")
+    mode.add_argument("--concurrency", type=int, default=4, help="固定并发（闭环）")
+    parser.add_argument("--duration", type=float, default=30, help="持续时间（秒）")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="题库文件 glob")
+    parser.add_argument("--limit", type=int, help="只使用前 N 道题")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument(
+        "--adaptive", action="store_true", help="按检索分数自适应决定文档块数量"
+    )
+    parser.add_argument("--persist-dir", help="已有向量数据库，不设置则构建合成知识库")
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="压测期间每隔若干秒检查知识库新版本，发现后预热并切换（其他进程重建时使用）",
+    )
+    parser.add_argument("--upstream", help="使用外部服务，不启动内置模拟服务")
+    parser.add_argument("--embed-latency-ms", type=float, default=15.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=800.0)
+    parser.add_argument(
+        "--latency-sigma", type=float, default=0.5, help="模拟服务延迟的对数正态抖动"
+    )
+    parser.add_argument("--rate-limit", type=float, help="模拟服务每秒请求数上限")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_query.json", help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    questions = load_workload(args.questions, args.limit, args.seed)
+    if not questions:
+        parser.error(f"没有找到题库文件: {args.questions}")
+
+    # 每个请求都会记录 INFO 日志，压测时只保留警告
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = None
+    if not args.upstream:
+        server = FakeOpenAIServer(
+            embed_latency_ms=args.embed_latency_ms,
+            per_text_ms=0,
+            chat_latency_ms=args.chat_latency_ms,
+            latency_sigma=args.latency_sigma,
+            rate_limit=args.rate_limit,
+            seed=args.seed,
+        ).start()
+    base_url = args.upstream or server.base_url
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    from rag_main import RAGSystem
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_query_") as work_dir:
+            persist_dir = args.persist_dir or _build_index(work_dir)
+            rag_system = RAGSystem(persist_dir=persist_dir)
+            # 预热：打开数据库、建立连接，不计入结果
+            rag_system.query(questions[0], k=args.k)
+            telemetry.reset()
+
+            generator = LoadGenerator(
+                rag_system, questions, k=args.k, adaptive=args.adaptive
+            )
+            if args.watch:
+                rag_system.start_watcher(interval=args.watch)
+            try:
+                if args.qps:
+                    sent, elapsed = generator.run_qps(args.qps, args.duration)
+                else:
+                    sent, elapsed = generator.run_concurrency(
+                        args.concurrency, args.duration
+                    )
+            finally:
+                rag_system.stop_watcher()
+    finally:
+        if server is not None:
+            server.stop()
+
+    upstream = "external"
+    if not args.upstream:
+        upstream = {
+            "embed_latency_ms": args.embed_latency_ms,
+            "chat_latency_ms": args.chat_latency_ms,
+            "latency_sigma": args.latency_sigma,
+            "rate_limit": args.rate_limit,
+        }
+    result = {
+        "config": {
+            "mode": "qps" if args.qps else "concurrency",
+            "qps": args.qps,
+            "concurrency": None if args.qps else args.concurrency,
+            "duration": args.duration,
+            "k": args.k,
+            "adaptive": args.adaptive,
+            "watch": args.watch,
+            "questions": len(questions),
+            "upstream": upstream,
+        },
+        **generator.report(sent, elapsed),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+    print(
+        f"请求 {result['requests']} 个，失败 {result['failed']} 个"
+        f"（{result['error_rate']:.2%}），吞吐 {result['throughput_qps']} QPS"
+    )
+    print(f"端到端延迟 (ms): {result['latency_ms']}")
+    for name, values in result["stages_ms"].items():
+        print(f"  {name:<12} {values}")
+    print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 仅构建知识库时才需要的依赖，查询进程启动时不应导入
+INGESTION_MODULES = (
+    "langchain_community",
+    "langchain_text_splitters",
+    "unstructured",
+    "fitz",
+    "pymilvus",
+    "tqdm",
+    "openai",
+)
+
+# 在子进程中导入 rag_main 并创建 RAGSystem，返回耗时和已导入的重量级模块
+_STARTUP_SNIPPET = """
+import json, os, sys, time
+start = time.perf_counter()
+import rag_main
+imported = time.perf_counter()
+rag_main.RAGSystem(persist_dir=os.path.join(os.getcwd(), "bench_startup.db"))
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "init_ms": (ready - imported) * 1000,
+    "loaded": sorted({name.split(".")[0] for name in sys.modules} & set(%r)),
+}))
+"""
+
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(累计微秒, 模块名)]，只保留顶层导入"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # 模块名前的缩进表示嵌套层级，顶层导入没有缩进
+        if not name.startswith("  "):
+            modules.append((int(cumulative), name.strip()))
+    return modules
+
+
+def measure_startup(python=sys.executable):
+    """在全新子进程中测量查询进程的冷启动开销"""
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "bench"))
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", _STARTUP_SNIPPET % (INGESTION_MODULES,)],
+        cwd=RAG_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    stats["top_imports"] = sorted(parse_importtime(result.stderr), reverse=True)[:10]
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查询进程冷启动基准")
+    parser.add_argument(
+        "--budget-ms", type=float, default=500, help="导入 + 初始化的时间预算（毫秒）"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最小值")
+    args = parser.parse_args(argv)
+
+    runs = [measure_startup() for _ in range(args.repeat)]
+    best = min(runs, key=lambda run: run["import_ms"] + run["init_ms"])
+    total = best["import_ms"] + best["init_ms"]
+
+    print(f"导入 rag_main: {best['import_ms']:.1f} ms")
+    print(f"初始化 RAGSystem: {best['init_ms']:.1f} ms")
+    print("耗时最多的顶层导入:")
+    for cumulative, name in best["top_imports"]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if best["loaded"]:
+        print(f"启动时导入了构建专用依赖: {', '.join(best['loaded'])}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"启动耗时 {total:.1f} ms 超出预算 {args.budget_ms:.0f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print(f"启动耗时 {total:.1f} ms，在预算 {args.budget_ms:.0f} ms 之内")
+
+
+if __name__ == "__main__":
+    main()
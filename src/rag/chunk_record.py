@@ -0,0 +1,151 @@
+"""构建知识库时使用的紧凑文档块记录
+
+切割后的每个块不再复制一份页面元数据：块只保存正文、来源（sys.intern 后全部块共用一个字符串）、
+整数页码和节号，其余页面级元数据（文件路径、标题、作者等）引用加载器给出的原字典，
+同一页的所有块共用。只有写出 JSONL、写入向量库或交给 langchain 时才按需生成元数据字典。
+"""
+
+import sys
+
+# 块级字段，按加入元数据的先后顺序排列；值为 None 时不出现在元数据中
+_FIELDS = ("section", "page_start", "page_end", "chunk_id")
+
+
+def _page_number(value):
+    """页码统一为整数，无法转换时原样保留"""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class Chunk:
+    """一个文档块；page_content 和 metadata 与 langchain Document 同名，可直接替代使用"""
+
+    __slots__ = (
+        "page_content",
+        "source",
+        "page",
+        "section",
+        "page_start",
+        "page_end",
+        "chunk_id",
+        "_base",
+        "_extra",
+    )
+
+    def __init__(
+        self,
+        page_content,
+        base=None,
+        section=None,
+        page_start=None,
+        page_end=None,
+        chunk_id=None,
+    ):
+        base = base or {}
+        self.page_content = page_content
+        source = base.get("source")
+        self.source = sys.intern(source) if isinstance(source, str) else source
+        self.page = _page_number(base.get("page"))
+        self.section = section
+        self.page_start = _page_number(page_start)
+        self.page_end = _page_number(page_end)
+        self.chunk_id = chunk_id
+        # 页面级元数据，多个块共用，只读
+        self._base = base
+        # 块级的其他元数据（如近重复来源），大多数块没有
+        self._extra = None
+
+    @classmethod
+    def from_document(cls, doc):
+        """由 langchain Document 构造，已有的块级字段一并保留"""
+        chunk = cls(doc.page_content, doc.metadata)
+        for key, value in doc.metadata.items():
+            if key in _FIELDS:
+                chunk.set(key, value)
+        return chunk
+
+    @property
+    def metadata(self):
+        """完整的元数据字典，每次调用都新建；修改请用 set()"""
+        metadata = dict(self._base)
+        if self.source is not None:
+            metadata["source"] = self.source
+        if self.page is not None:
+            metadata["page"] = self.page
+        for name in _FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                metadata[name] = value
+        if self._extra:
+            metadata.update(self._extra)
+        return metadata
+
+    def get(self, key, default=None):
+        """读取单个元数据字段，不构造整个字典"""
+        if key in _FIELDS or key in ("source", "page"):
+            value = getattr(self, key)
+            return default if value is None else value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        return self._base.get(key, default)
+
+    def set(self, key, value):
+        if key in _FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def setdefault(self, key, default):
+        value = self.get(key)
+        if value is None:
+            self.set(key, default)
+            return default
+        return value
+
+    def to_document(self):
+        from langchain.docstore.document import Document
+
+        return Document(page_content=self.page_content, metadata=self.metadata)
+
+    def __repr__(self):
+        return (
+            f"Chunk(source={self.source!r}, page={self.page!r}, "
+            f"section={self.section!r}, chars={len(self.page_content)})"
+        )
+
+
+def split_records(documents, split_text, numbered=True):
+    """按页切割 Document，返回 Chunk 列表；numbered=True 时记录块在页内的节号（从 1 开始）"""
+    chunks = []
+    for doc in documents:
+        for i, text in enumerate(split_text(doc.page_content)):
+            chunks.append(Chunk(text, doc.metadata, section=i + 1 if numbered else None))
+    return chunks
+
+
+def get_metadata(doc, key, default=None):
+    """Chunk 和 langchain Document 通用的元数据读取"""
+    if isinstance(doc, Chunk):
+        return doc.get(key, default)
+    return doc.metadata.get(key, default)
+
+
+def set_metadata(doc, key, value):
+    """Chunk 和 langchain Document 通用的元数据写入"""
+    if isinstance(doc, Chunk):
+        doc.set(key, value)
+    else:
+        doc.metadata[key] = value
+
+
+def setdefault_metadata(doc, key, default):
+    """Chunk 和 langchain Document 通用的 setdefault"""
+    if isinstance(doc, Chunk):
+        return doc.setdefault(key, default)
+    return doc.metadata.setdefault(key, default)
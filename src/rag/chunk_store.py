@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+
+from chunk_record import set_metadata
+
+CHUNKS_FILE = "chunks.jsonl"
+INDEX_FILE = "chunks.idx.json"
+
+
+def _source_name(metadata):
+    return os.path.basename(metadata.get("source", "unknown_file"))
+
+
+def _dump_chunks(f, documents, offsets, sources):
+    """顺序写出文档块并更新偏移表和来源索引
+
+    offsets 末尾为当前文件总长度，第 i 块占据 [offsets[i], offsets[i + 1])。
+    文档块按顺序编号，编号同时写入元数据的 chunk_id，便于检索结果回查。
+    documents 可以是 Chunk 或 langchain Document。
+    """
+    offset = offsets.pop()
+    for doc in documents:
+        chunk_id = len(offsets)
+        set_metadata(doc, "chunk_id", chunk_id)
+        metadata = doc.metadata
+        source = _source_name(metadata)
+        line = (
+            json.dumps(
+                {
+                    "id": chunk_id,
+                    "source": source,
+                    "text": doc.page_content,
+                    "metadata": metadata,
+                },
+                ensure_ascii=False,
+            )
+            + "\n"
+        ).encode("utf-8")
+        f.write(line)
+        offsets.append(offset)
+        offset += len(line)
+        sources.setdefault(source, []).append(chunk_id)
+    offsets.append(offset)
+
+
+def _write_index(index_path, offsets, sources):
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"offsets": offsets, "sources": sources}, f, ensure_ascii=False)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def write_chunks(documents, output_dir):
+    """顺序写出所有文档块到单个 JSONL 文件，并生成字节偏移索引"""
+    os.makedirs(output_dir, exist_ok=True)
+    chunks_path = os.path.join(output_dir, CHUNKS_FILE)
+
+    offsets = [0]
+    sources = {}
+    # 先写临时文件再替换，避免逐个删除旧文件
+    with open(chunks_path + ".tmp", "wb") as f:
+        _dump_chunks(f, documents, offsets, sources)
+    os.replace(chunks_path + ".tmp", chunks_path)
+    _write_index(os.path.join(output_dir, INDEX_FILE), offsets, sources)
+    return chunks_path
+
+
+def append_chunks(documents, output_dir):
+    """在已有文档块文件末尾追加文档块，编号接续已有编号"""
+    if not os.path.exists(os.path.join(output_dir, INDEX_FILE)):
+        return write_chunks(documents, output_dir)
+
+    store = ChunkStore(output_dir)
+    offsets, sources = store.offsets, store.sources
+    with open(store.chunks_path, "r+b") as f:
+        # 从索引记录的末尾写起，丢弃上次中断时可能残留的半行
+        f.seek(offsets[-1])
+        f.truncate()
+        _dump_chunks(f, documents, offsets, sources)
+    _write_index(os.path.join(output_dir, INDEX_FILE), offsets, sources)
+    return store.chunks_path
+
+
+class ChunkStore:
+    """按编号或来源随机读取 write_chunks 生成的文档块"""
+
+    def __init__(self, output_dir):
+        self.chunks_path = os.path.join(output_dir, CHUNKS_FILE)
+        with open(os.path.join(output_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.offsets = index["offsets"]
+        self.sources = index["sources"]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def get(self, chunk_id):
+        """按编号读取单个文档块"""
+        if not 0 <= chunk_id < len(self):
+            raise KeyError(f"chunk {chunk_id} does not exist")
+        with open(self.chunks_path, "rb") as f:
+            f.seek(self.offsets[chunk_id])
+            data = f.read(self.offsets[chunk_id + 1] - self.offsets[chunk_id])
+        return json.loads(data)
+
+    def find_sources(self, name):
+        """按文件名（或不含扩展名的文件名、子串）匹配来源"""
+        if name in self.sources:
+            return [name]
+        return [source for source in self.sources if name in source]
+
+    def by_source(self, name):
+        """按来源文件读取全部文档块"""
+        with open(self.chunks_path, "rb") as f:
+            for source in self.find_sources(name):
+                for chunk_id in self.sources[source]:
+                    f.seek(self.offsets[chunk_id])
+                    yield json.loads(f.readline())
+
+    def __iter__(self):
+        with open(self.chunks_path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def live_chunks_dir(persist_dir, alias=None):
+    """知识库上线版本的文档块目录（记录在集合版本清单中），没有记录时返回 None"""
+    from index_registry import DEFAULT_ALIAS, CollectionRegistry, manifest_path
+
+    registry = CollectionRegistry(manifest_path(persist_dir))
+    version = registry.get(registry.resolve(alias or DEFAULT_ALIAS))
+    return version.get("output_dir") if version else None
+
+
+def _print_chunk(chunk):
+    print(f"===== chunk {chunk['id']} | {chunk['source']} =====")
+    print(chunk["text"])
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看切割后的文档块")
+    parser.add_argument(
+        "output_dir",
+        nargs="?",
+        help="文档块目录，例如 output/chapter/rag_collection_v3；不指定时使用知识库上线版本的文档块",
+    )
+    parser.add_argument(
+        "--persist-dir",
+        default="data_base/vector_db/408.db",
+        help="不指定文档块目录时，从该知识库的版本清单中查找上线版本",
+    )
+    parser.add_argument("--alias", help="知识库别名，默认 rag_collection")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--id", type=int, nargs="+", help="按编号打印文档块")
+    group.add_argument("--source", help="按来源文件名打印全部文档块")
+    group.add_argument("--list", action="store_true", help="列出所有来源及块数")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or live_chunks_dir(args.persist_dir, args.alias)
+    if not output_dir:
+        parser.error("版本清单中没有上线版本的文档块目录，请指定 output_dir")
+    store = ChunkStore(output_dir)
+    if args.list:
+        for source, ids in store.sources.items():
+            print(f"{len(ids):>8}  {source}")
+        print(f"共 {len(store)} 个文档块")
+    elif args.id is not None:
+        for chunk_id in args.id:
+            _print_chunk(store.get(chunk_id))
+    else:
+        for chunk in store.by_source(args.source):
+            _print_chunk(chunk)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import importlib
+import os
+import sys
+
+import telemetry
+from embedding_apis import EMBEDDING_BACKENDS
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+EVAL_DIR = os.path.join(PROJECT_DIR, "src", "eval")
+
+DEFAULT_PERSIST_DIR = os.path.join(PROJECT_DIR, "data_base/vector_db/408.db")
+DEFAULT_DATA_DIR = os.path.join(PROJECT_DIR, "data_base/knowledge_db")
+
+# bench 子命令的基准类型，对应 bench_<kind>.py 的 main(argv)
+BENCHMARKS = ["startup", "ingest", "query", "hybrid", "prefix_cache", "memory"]
+
+
+def _add_index_options(parser):
+    """知识库相关的公共参数"""
+    parser.add_argument(
+        "--persist-dir",
+        default=DEFAULT_PERSIST_DIR,
+        help="向量数据库文件路径（Milvus Lite）或 Milvus 服务地址",
+    )
+    parser.add_argument(
+        "--strategy",
+        default="chapter",
+        choices=["default", "paper", "chapter"],
+        help="文本切割策略",
+    )
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument(
+        "--output-dir",
+        help="切割结果保存目录，默认 output/<strategy>，每个集合版本写入以集合名命名的子目录",
+    )
+    parser.add_argument("--cache-dir", help="向量缓存目录，重建时复用已计算的向量")
+    parser.add_argument(
+        "--embedding",
+        choices=EMBEDDING_BACKENDS,
+        help="向量化后端，默认读取 RAG_EMBEDDING_BACKEND（缺省为 openai）",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=1, help="并发请求数（向量化批次或评测题目）"
+    )
+
+
+def _add_build_options(parser):
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="知识库文档目录")
+    parser.add_argument(
+        "--cross-page", action="store_true", help="chapter 策略按整个文件跨页切割"
+    )
+    parser.add_argument(
+        "--dedup-threshold", type=float, help="近重复去重的相似度阈值，不设置则不去重"
+    )
+    parser.add_argument(
+        "--index-type",
+        default="FLAT",
+        choices=["FLAT", "IVF_FLAT", "HNSW", "AUTOINDEX"],
+        help="向量索引类型",
+    )
+    parser.add_argument(
+        "--sparse",
+        action="store_true",
+        help="同时存储稀疏向量，检索时使用稠密 + 稀疏混合检索",
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="408rag", description="408-RAG 命令行工具")
+    parser.add_argument(
+        "--profile", action="store_true", help="结束时输出各处理阶段的耗时"
+    )
+    parser.add_argument(
+        "--metrics-file", help="结束时以 Prometheus 文本格式写出指标到该文件"
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, help="运行期间在该端口提供 Prometheus /metrics"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="构建知识库")
+    _add_index_options(build)
+    _add_build_options(build)
+    build.add_argument("--force", action="store_true", help="知识库已存在时也重新构建")
+    build.add_argument(
+        "--questions", nargs="*", default=[], help="同时构建题库检索集合的题库文件"
+    )
+
+    update = subparsers.add_parser("update", help="增量添加新文档到知识库")
+    _add_index_options(update)
+    _add_build_options(update)
+
+    query = subparsers.add_parser("query", help="检索并生成答案")
+    _add_index_options(query)
+    query.add_argument("question")
+    query.add_argument("-k", type=int, default=3, help="检索的文档块数量")
+    query.add_argument("--examples", type=int, default=0, help="附加的题库例题数量")
+    query.add_argument("--stream", action="store_true", help="流式输出答案")
+    query.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="按检索分数自适应决定文档块数量，答案缓存或题库原题命中时跳过检索",
+    )
+
+    search = subparsers.add_parser("search", help="只检索，打印相关文档块")
+    _add_index_options(search)
+    search.add_argument("question")
+    search.add_argument("-k", type=int, default=3, help="检索的文档块数量")
+    search.add_argument(
+        "--adaptive", action="store_true", help="按检索分数自适应决定文档块数量"
+    )
+
+    collections = subparsers.add_parser("collections", help="管理知识库集合版本")
+    _add_index_options(collections)
+    collections.add_argument(
+        "action",
+        choices=["list", "activate", "gc"],
+        help="列出版本/切换上线版本/回收旧版本",
+    )
+    collections.add_argument("name", nargs="?", help="activate 的目标集合名")
+    collections.add_argument(
+        "--keep", type=int, default=1, help="gc 时保留的已下线版本数"
+    )
+
+    evaluate = subparsers.add_parser("eval", help="运行选择题评测")
+    evaluate.add_argument("--questions", default="data/test_data/questions_400.json")
+    evaluate.add_argument(
+        "--output", default="output/400_question/qwen3_8b_400_question.jsonl"
+    )
+    evaluate.add_argument("--base-url", default="http://localhost:8000/v1")
+    evaluate.add_argument("--api-key", default="YOUR_API_KEY")
+    evaluate.add_argument("--model", help="模型名，默认使用服务端的第一个模型")
+    evaluate.add_argument("--concurrency", type=int, default=1)
+    evaluate.add_argument("--limit", type=int, help="只评测前 N 道题")
+    evaluate.add_argument("--seed", type=int, help="打乱题目顺序的随机种子")
+    evaluate.add_argument(
+        "--mode",
+        choices=["single", "packed", "offline"],
+        default="single",
+        help="每题一次请求/多题打包为一次请求/离线批处理接口",
+    )
+    evaluate.add_argument(
+        "--batch-size", type=int, default=8, help="packed 模式每次请求的题目数"
+    )
+    evaluate.add_argument(
+        "--price-input", type=float, default=0.0, help="输入每百万 token 价格"
+    )
+    evaluate.add_argument(
+        "--price-output", type=float, default=0.0, help="输出每百万 token 价格"
+    )
+    evaluate.add_argument(
+        "--batch-timeout",
+        type=float,
+        help="offline 模式批任务的最长等待时间（秒），超时后取消并逐题在线作答",
+    )
+    evaluate.add_argument("--report", help="吞吐和每题成本报告 JSON 文件")
+    evaluate.add_argument(
+        "--json-mode",
+        action="store_true",
+        help="单题以 JSON 格式作答（服务端需支持 response_format）",
+    )
+    evaluate.add_argument(
+        "--max-retries", type=int, default=2, help="单题请求失败或无法解析时的重试次数"
+    )
+    evaluate.add_argument(
+        "--no-resume",
+        dest="resume",
+        action="store_false",
+        help="不跳过结果文件中已有成功记录的题目",
+    )
+    evaluate.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="只重新作答结果文件中带失败原因的题目",
+    )
+
+    bench = subparsers.add_parser("bench", help="运行基准测试")
+    bench.add_argument("kind", choices=BENCHMARKS, help="基准类型")
+    bench.add_argument(
+        "bench_args", nargs=argparse.REMAINDER, help="传给对应基准脚本的参数"
+    )
+
+    return parser
+
+
+def _create_rag_system(args):
+    from embedding_apis import create_embedding
+    from rag_main import RAGSystem
+
+    embedding = create_embedding(
+        args.embedding, max_workers=args.concurrency, cache_dir=args.cache_dir
+    )
+    return RAGSystem(
+        persist_dir=args.persist_dir,
+        strategy=args.strategy,
+        cross_page=getattr(args, "cross_page", False),
+        dedup_threshold=getattr(args, "dedup_threshold", None),
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        index_type=getattr(args, "index_type", "FLAT"),
+        output_dir=args.output_dir,
+        embedding=embedding,
+        sparse=getattr(args, "sparse", False),
+    )
+
+
+def _run(args):
+    if args.command == "build":
+        if "://" not in args.persist_dir:
+            os.makedirs(os.path.dirname(args.persist_dir), exist_ok=True)
+        rag_system = _create_rag_system(args)
+        rag_system.build_knowledge_base(args.data_dir, force=args.force)
+        if args.questions:
+            rag_system.build_question_bank(args.questions)
+
+    elif args.command == "update":
+        _create_rag_system(args).update_knowledge_base(args.data_dir)
+
+    elif args.command == "query":
+        rag_system = _create_rag_system(args)
+        options = dict(k=args.k, examples=args.examples, adaptive=args.adaptive)
+        if args.stream:
+            for text in rag_system.query_stream(args.question, **options):
+                print(text, end="", flush=True)
+            print()
+        else:
+            print(rag_system.query(args.question, **options))
+
+    elif args.command == "search":
+        docs = _create_rag_system(args).search(
+            args.question, k=args.k, adaptive=args.adaptive
+        )
+        for doc in docs:
+            metadata = doc.metadata
+            print(
+                f"===== chunk {metadata.get('chunk_id')} | "
+                f"{os.path.basename(metadata.get('source', ''))} "
+                f"p{metadata.get('page', '?')} | "
+                f"score {metadata.get('score', 0):.4f} ====="
+            )
+            print(doc.page_content)
+            print()
+
+    elif args.command == "collections":
+        rag_system = _create_rag_system(args)
+        registry = rag_system.registry
+        if args.action == "list":
+            live = registry.resolve(rag_system.alias)
+            for version in registry.versions(rag_system.alias):
+                marker = "*" if version["name"] == live else " "
+                print(
+                    f"{marker} {version['name']:<24}{version['status']:<10}"
+                    f"{version['created_at']}  strategy={version.get('strategy')} "
+                    f"chunk_size={version.get('chunk_size')} model={version.get('model')}"
+                )
+        elif args.action == "activate":
+            if not args.name:
+                raise SystemExit("activate 需要指定集合名")
+            registry.activate(args.name)
+            print(f"{rag_system.alias} -> {args.name}")
+        else:
+            for name in rag_system.collect_garbage(keep=args.keep):
+                print(f"已删除 {name}")
+
+    elif args.command == "eval":
+        sys.path.insert(0, EVAL_DIR)
+        from test_question import run_eval
+
+        run_eval(
+            test_path=args.questions,
+            output_path=args.output,
+            base_url=args.base_url,
+            api_key=args.api_key,
+            model_name=args.model,
+            concurrency=args.concurrency,
+            limit=args.limit,
+            seed=args.seed,
+            mode=args.mode,
+            batch_size=args.batch_size,
+            price_input=args.price_input,
+            price_output=args.price_output,
+            report_path=args.report,
+            json_mode=args.json_mode,
+            max_retries=args.max_retries,
+            batch_timeout=args.batch_timeout,
+            resume=args.resume,
+            retry_failed=args.retry_failed,
+        )
+
+    elif args.command == "bench":
+        importlib.import_module(f"bench_{args.kind}").main(args.bench_args)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.metrics_port:
+        telemetry.serve_prometheus(args.metrics_port)
+    try:
+        _run(args)
+    finally:
+        if args.profile:
+            print(telemetry.format_timings(), file=sys.stderr)
+        if args.metrics_file:
+            telemetry.write_prometheus(args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import hashlib
+import random
+import re
+import zlib
+from collections import defaultdict
+
+from chunk_record import get_metadata, setdefault_metadata
+
+try:
+    import numpy as np
+except ImportError:  # numpy 不可用时退回纯 Python 实现
+    np = None
+
+# 2^31 - 1 为素数，且 a * h + b 不会超出 uint64 范围，便于 numpy 向量化
+_PRIME = (1 << 31) - 1
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """归一化文本：去除所有空白并转为小写"""
+    return _WHITESPACE.sub("", text).lower()
+
+
+def shingle_hashes(text, shingle_size=5):
+    """将归一化文本切成字符 n-gram，并返回其 32 位哈希集合"""
+    if len(text) <= shingle_size:
+        return {zlib.crc32(text.encode("utf-8")) & _PRIME}
+    return {
+        zlib.crc32(text[i : i + shingle_size].encode("utf-8")) & _PRIME
+        for i in range(len(text) - shingle_size + 1)
+    }
+
+
+class MinHashLSH:
+    """MinHash 签名 + LSH 分桶索引，用于快速查找近似重复文本"""
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self.perms = [
+            (rng.randint(1, _PRIME - 1), rng.randint(0, _PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        if np is not None:
+            self._a = np.array([a for a, _ in self.perms], dtype=np.uint64)[:, None]
+            self._b = np.array([b for _, b in self.perms], dtype=np.uint64)[:, None]
+
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+
+    def signature(self, text):
+        """计算文本的 MinHash 签名"""
+        hashes = shingle_hashes(normalize_text(text), self.shingle_size)
+        if np is not None:
+            values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+            return tuple(((self._a * values + self._b) % _PRIME).min(axis=1).tolist())
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.perms)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, signature[start : start + self.rows]
+
+    def add(self, key, signature):
+        """将签名加入 LSH 索引"""
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band][band_key].append(key)
+
+    def query(self, signature):
+        """返回与签名至少有一个分桶相同的候选键"""
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        return candidates
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        """由签名估计两段文本的 Jaccard 相似度"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class NearDuplicateFilter:
+    """文本块近重复去重：每组近重复块只保留首个代表块，其余来源记入元数据"""
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=5):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+
+    @staticmethod
+    def _source_label(doc):
+        source = get_metadata(doc, "source", "unknown_file")
+        page = get_metadata(doc, "page")
+        return source if page is None else f"{source}:{page}"
+
+    def deduplicate(self, documents):
+        """返回 (保留的文档块列表, 被合并掉的块数)"""
+        lsh = MinHashLSH(
+            num_perm=self.num_perm, bands=self.bands, shingle_size=self.shingle_size
+        )
+        exact = {}
+        signatures = []
+        kept = []
+
+        for doc in documents:
+            # 1. 完全相同的文本直接按哈希合并，无需计算签名
+            digest = hashlib.md5(
+                normalize_text(doc.page_content).encode("utf-8")
+            ).digest()
+            target = exact.get(digest)
+
+            # 2. 通过 LSH 候选 + 签名相似度判断近重复
+            signature = None
+            if target is None:
+                signature = lsh.signature(doc.page_content)
+                best_score = self.threshold
+                for candidate in lsh.query(signature):
+                    score = MinHashLSH.similarity(signature, signatures[candidate])
+                    if score >= best_score:
+                        target, best_score = candidate, score
+
+            if target is None:
+                index = len(kept)
+                exact[digest] = index
+                lsh.add(index, signature)
+                signatures.append(signature)
+                kept.append(doc)
+                continue
+
+            exact.setdefault(digest, target)
+            representative = kept[target]
+            label = self._source_label(doc)
+            alternates = setdefault_metadata(representative, "duplicate_sources", [])
+            if label != self._source_label(representative) and label not in alternates:
+                alternates.append(label)
+
+        return kept, len(documents) - len(kept)
@@ -1,11 +1,16 @@
 import re
+import logging
+from bisect import bisect_right
 from langchain_community.document_loaders import (
     PyMuPDFLoader,
     UnstructuredMarkdownLoader,
 )
 from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
-from typing import List
+from typing import List, Tuple
 from langchain.docstore.document import Document
+from chunk_record import Chunk, split_records
+from dedup import NearDuplicateFilter
+from telemetry import span
 
 
 class PaperTextSplitter(TextSplitter):
@@ -36,23 +41,21 @@ class PaperTextSplitter(TextSplitter):
                 chunks.append(section)
         return chunks
 
+    def split_records(self, documents: List[Document]) -> List[Chunk]:
+        """切割为紧凑的 Chunk 记录，页面元数据不复制"""
+        return split_records(documents, self.split_text)
+
     def split_documents(self, documents: List[Document]) -> List[Document]:
-        new_docs = []
-        for doc in documents:
-            chunks = self.split_text(doc.page_content)
-            for i, chunk in enumerate(chunks):
-                metadata = doc.metadata.copy()
-                metadata["section"] = i + 1
-                new_doc = Document(page_content=chunk, metadata=metadata)
-                new_docs.append(new_doc)
-        return new_docs
+        return [chunk.to_document() for chunk in self.split_records(documents)]
 
 
 class ChapterTitleSplitter(TextSplitter):
-    def __init__(self, chunk_size=500, chunk_overlap=50, **kwargs):
+    def __init__(self, chunk_size=500, chunk_overlap=50, cross_page=False, **kwargs):
         super().__init__(**kwargs)
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # cross_page=True 时按文件拼接所有页面后再切割，避免跨页章节被截断
+        self.cross_page = cross_page
 
     def split_text(self, text: str) -> List[str]:
         # Regex to split by chapters (e.g., "第1章") and titles (e.g., "1.1", "1.1.1")
@@ -76,22 +79,78 @@ class ChapterTitleSplitter(TextSplitter):
                 chunks.append(section)
         return chunks
 
+    def split_text_with_offsets(self, text: str) -> List[Tuple[str, int]]:
+        """切割文本，并返回每个块在原文中的起始偏移"""
+        results = []
+        index = 0
+        previous_len = 0
+        for chunk in self.split_text(text):
+            # 块之间最多重叠 chunk_overlap 个字符，从上一块末尾往前回退查找即可
+            offset = max(0, index + previous_len - self.chunk_overlap)
+            found = text.find(chunk, offset)
+            index = found if found >= 0 else offset
+            previous_len = len(chunk)
+            results.append((chunk, index))
+        return results
+
+    def split_records(self, documents: List[Document]) -> List[Chunk]:
+        """切割为紧凑的 Chunk 记录，页面元数据不复制"""
+        if self.cross_page:
+            return self._split_records_cross_page(documents)
+        return split_records(documents, self.split_text)
+
     def split_documents(self, documents: List[Document]) -> List[Document]:
-        new_docs = []
+        return [chunk.to_document() for chunk in self.split_records(documents)]
+
+    def _split_records_cross_page(self, documents: List[Document]) -> List[Chunk]:
+        """按文件拼接全部页面后切割，并通过页偏移表记录每个块的起止页码"""
+        files = {}
         for doc in documents:
-            chunks = self.split_text(doc.page_content)
-            for i, chunk in enumerate(chunks):
-                metadata = doc.metadata.copy()
-                metadata["section"] = i + 1
-                new_doc = Document(page_content=chunk, metadata=metadata)
-                new_docs.append(new_doc)
+            files.setdefault(doc.metadata.get("source"), []).append(doc)
+
+        new_docs = []
+        for pages in files.values():
+            # page_starts[i] 为第 i 页在拼接文本中的起始偏移
+            page_starts = []
+            offset = 0
+            for doc in pages:
+                page_starts.append(offset)
+                offset += len(doc.page_content) + 1
+            text = "\n".join(doc.page_content for doc in pages)
+
+            for i, (chunk, start) in enumerate(self.split_text_with_offsets(text)):
+                first = bisect_right(page_starts, start) - 1
+                last = bisect_right(page_starts, start + len(chunk) - 1) - 1
+                new_docs.append(
+                    Chunk(
+                        chunk,
+                        pages[first].metadata,
+                        section=i + 1,
+                        page_start=pages[first].metadata.get("page", first),
+                        page_end=pages[last].metadata.get("page", last),
+                    )
+                )
         return new_docs
 
 
 class DocumentProcessor:
-    def __init__(self, chunk_size=500, chunk_overlap=50, strategy="default"):
+    def __init__(
+        self,
+        chunk_size=500,
+        chunk_overlap=50,
+        strategy="default",
+        cross_page=False,
+        dedup_threshold=None,
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # dedup_threshold 为 None 时不去重，否则为近重复判定的 Jaccard 相似度阈值
+        self.dedup_filter = (
+            NearDuplicateFilter(threshold=dedup_threshold)
+            if dedup_threshold is not None
+            else None
+        )
+        self.dedup_stats = None
 
         if strategy == "paper":
             self.text_splitter = PaperTextSplitter(
@@ -99,7 +158,9 @@ class DocumentProcessor:
             )
         elif strategy == "chapter":
             self.text_splitter = ChapterTitleSplitter(
-                chunk_size=chunk_size, chunk_overlap=chunk_overlap
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                cross_page=cross_page,
             )
         else:
             self.text_splitter = RecursiveCharacterTextSplitter(
@@ -130,16 +191,37 @@ class DocumentProcessor:
         text = text.replace("•", "").replace(" ", "").replace("\n\n", "\n")
         return text
 
+    def split_records(self, documents):
+        """切割文档；默认策略不记录节号，与 RecursiveCharacterTextSplitter.split_documents 一致"""
+        if hasattr(self.text_splitter, "split_records"):
+            return self.text_splitter.split_records(documents)
+        return split_records(documents, self.text_splitter.split_text, numbered=False)
+
     def process_documents(self, file_paths):
-        """完整文档处理流程"""
+        """完整文档处理流程，返回 Chunk 列表（需要 langchain Document 时调用 to_document）"""
         # 1. 加载文档
-        docs = self.load_documents(file_paths)
+        with span("load", files=len(file_paths)) as current:
+            docs = self.load_documents(file_paths)
+            current.set("documents", len(docs))
 
         # 2. 清洗文档内容
-        for doc in docs:
-            doc.page_content = self.clean_text(doc.page_content)
-
-        # 3. 分割文档
-        split_docs = self.text_splitter.split_documents(docs)
+        with span("clean", documents=len(docs)):
+            for doc in docs:
+                doc.page_content = self.clean_text(doc.page_content)
+
+        # 3. 分割文档，得到紧凑的 Chunk 记录
+        with span("split", documents=len(docs)) as current:
+            split_docs = self.split_records(docs)
+            current.set("chunks", len(split_docs))
+
+        # 4. 近重复去重，每组只保留一个代表块参与向量化
+        if self.dedup_filter:
+            total = len(split_docs)
+            with span("dedup", chunks=total):
+                split_docs, removed = self.dedup_filter.deduplicate(split_docs)
+            self.dedup_stats = {"total": total, "kept": len(split_docs), "saved": removed}
+            logging.info(
+                f"近重复去重：{total} 个文档块保留 {len(split_docs)} 个，节省 {removed} 次向量化"
+            )
 
         return split_docs
@@ -1,31 +1,434 @@
 import os
-from openai import OpenAI
+import math
+import hashlib
+import shelve
+import threading
+import weakref
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv, find_dotenv
+from http_client import create_openai_client
+from telemetry import span
 
 # 加载环境变量
 _ = load_dotenv(find_dotenv())
 
 
-class OpenAIEmbedding:
-    def __init__(self, model="BAAI/bge-m3", batch_size=64):
+def lexical_sparse(text, ngram=2):
+    """字符 n-gram 的稀疏向量 {特征编号: 权重}，权重为 1 + log(词频)，L2 归一化
+
+    用于不提供稀疏输出的后端，作为混合检索中的词面匹配信号。
+    """
+    counts = {}
+    for start in range(max(1, len(text) - ngram + 1)):
+        gram = text[start : start + ngram]
+        if gram.strip():
+            key = zlib.crc32(gram.encode("utf-8")) & 0x7FFFFFFF
+            counts[key] = counts.get(key, 0) + 1
+    weights = {key: 1.0 + math.log(count) for key, count in counts.items()}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+    return {key: w / norm for key, w in weights.items()}
+
+
+class BaseEmbedding:
+    """向量化后端的公共部分：缓存、分批和并发
+
+    子类实现 _embed_batch(batch_texts)，需要按长度分桶等自定义分批时覆盖 _batches，
+    推理输入不是原文本（如已分词的编码）时覆盖 _compute。
+    """
+
+    def __init__(self, model, dim, batch_size=64, max_workers=1, cache_dir=None):
         self.model = model
+        # 向量维度，建库时用于定义向量字段
+        self.dim = dim
         self.batch_size = batch_size
-        self.client = OpenAI(
-            base_url=os.environ.get("OPENAI_BASE_URL"),
-            api_key=os.environ.get("OPENAI_API_KEY"),
-        )
+        # 并发执行的批次数
+        self.max_workers = max_workers
+        # 向量缓存目录，按 模型 + 文本 的哈希缓存，重建知识库时无需重复请求
+        self.cache_dir = cache_dir
+        # 缓存文件在首次使用时打开，整个生命周期只打开一次；dbm 不支持并发访问，读写都需持有锁
+        self._cache = None
+        self._cache_lock = threading.Lock()
+        self._cache_finalizer = None
+
+    def _cache_key(self, text, kind=""):
+        """kind 区分同一文本的不同输出（如稀疏向量），稠密向量为空串"""
+        prefix = f"{self.model}\0{kind}" if kind else self.model
+        return hashlib.sha1(f"{prefix}\0{text}".encode("utf-8")).hexdigest()
+
+    def _open_cache(self):
+        """调用方需持有 _cache_lock"""
+        if self._cache is None and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._cache = shelve.open(os.path.join(self.cache_dir, "embeddings"))
+            # 未显式 close() 时在对象回收或进程退出时关闭，保证缓存写回磁盘
+            self._cache_finalizer = weakref.finalize(self, self._cache.close)
+        return self._cache
+
+    def close(self):
+        """关闭向量缓存文件"""
+        with self._cache_lock:
+            if self._cache_finalizer is not None:
+                self._cache_finalizer()
+            self._cache = None
+            self._cache_finalizer = None
+
+    def _lookup(self, texts, kinds=("",)):
+        """从缓存读取每种输出，返回 (每种输出一个列表, 任一输出未命中的文本编号)"""
+        results = [[None] * len(texts) for _ in kinds]
+        missing = []
+        with self._cache_lock:
+            cache = self._open_cache()
+            for i, text in enumerate(texts):
+                if cache is not None:
+                    for result, kind in zip(results, kinds):
+                        result[i] = cache.get(self._cache_key(text, kind))
+                if any(result[i] is None for result in results):
+                    missing.append(i)
+        return results, missing
+
+    def _store(self, texts, batch, results, kinds=("",)):
+        """一批计算完成即写入缓存，构建中断后已计算的批次不必重算"""
+        if not self.cache_dir:
+            return
+        with self._cache_lock:
+            cache = self._open_cache()
+            for i in batch:
+                for result, kind in zip(results, kinds):
+                    cache[self._cache_key(texts[i], kind)] = result[i]
+
+    def _sync(self):
+        if self.cache_dir:
+            with self._cache_lock:
+                self._open_cache().sync()
+
+    def _map(self, fn, items):
+        """按顺序产出 fn(item)，max_workers > 1 时多个批次并发执行"""
+        if self.max_workers > 1 and len(items) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                yield from pool.map(fn, items)
+        else:
+            yield from map(fn, items)
+
+    def _embed_batch(self, batch_texts):
+        raise NotImplementedError
+
+    def _batches(self, texts, indices):
+        """将待计算的文本编号分批，默认按 batch_size 顺序切分"""
+        return [
+            indices[i : i + self.batch_size]
+            for i in range(0, len(indices), self.batch_size)
+        ]
+
+    def _compute(self, texts, indices):
+        """计算 indices 对应文本的向量，按批产出 (文本编号列表, 向量列表)"""
+        batches = self._batches(texts, indices)
+        batch_texts = [[texts[i] for i in batch] for batch in batches]
+        return zip(batches, self._map(self._embed_batch, batch_texts))
 
     def embed_documents(self, texts):
         """批量生成文档向量"""
-        result = []
-        for i in range(0, len(texts), self.batch_size):
-            batch_texts = texts[i : i + self.batch_size]
-            embeddings = self.client.embeddings.create(
-                input=batch_texts, model=self.model
-            )
-            result.extend([data.embedding for data in embeddings.data])
+        (result,), missing = self._lookup(texts)
+        if not missing:
+            return result
+        try:
+            for batch, embeddings in self._compute(texts, missing):
+                for i, embedding in zip(batch, embeddings):
+                    result[i] = embedding
+                self._store(texts, batch, (result,))
+        finally:
+            self._sync()
+        return result
+
+    def embed_array(self, texts):
+        """批量生成文档向量，结果放在预分配的 float32 矩阵（len(texts) × dim）中
+
+        按 batch_size × max_workers 分段调用 embed_documents，每段结果填入矩阵后即释放，
+        任一时刻只有一段向量以 Python float 列表的形式存在。没有安装 numpy 时
+        退回为每行一个 array("f")，同样按 float32 存放。
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if np is not None:
+            result = np.empty((len(texts), self.dim), dtype=np.float32)
+        else:
+            result = [None] * len(texts)
+        step = self.batch_size * max(self.max_workers, 1)
+        for start in range(0, len(texts), step):
+            vectors = self.embed_documents(texts[start : start + step])
+            if np is not None:
+                result[start : start + len(vectors)] = vectors
+            else:
+                for i, vector in enumerate(vectors, start):
+                    result[i] = array("f", vector)
         return result
 
     # 可选：补充单句嵌入方法（如需单独处理查询）
     def embed_query(self, text):
         return self.embed_documents([text])[0]
+
+    def embed_hybrid(self, texts):
+        """同时返回稠密向量和稀疏向量，默认稀疏部分使用字符 n-gram 词面权重"""
+        return self.embed_documents(texts), [lexical_sparse(text) for text in texts]
+
+
+class OpenAIEmbedding(BaseEmbedding):
+    """OpenAI 兼容的向量化接口（默认硅基流动的 bge-m3）"""
+
+    def __init__(
+        self,
+        model="BAAI/bge-m3",
+        batch_size=64,
+        max_workers=1,
+        cache_dir=None,
+        dim=1024,
+    ):
+        super().__init__(model, dim, batch_size, max_workers, cache_dir)
+        self._client = None
+
+    @property
+    def client(self):
+        """首次调用时再创建 OpenAI 客户端（openai 包导入较慢），与 LLM 共用连接池"""
+        if self._client is None:
+            self._client = create_openai_client()
+        return self._client
+
+    def _embed_batch(self, batch_texts):
+        with span("embed_batch", texts=len(batch_texts)) as current:
+            embeddings = self.client.embeddings.create(
+                input=batch_texts, model=self.model
+            )
+            usage = getattr(embeddings, "usage", None)
+            if usage is not None:
+                current.set("tokens", usage.total_tokens)
+        return [data.embedding for data in embeddings.data]
+
+
+class LocalOnnxEmbedding(BaseEmbedding):
+    """本地 CPU 上运行的 ONNX 版 bge 模型
+
+    model_dir 下需要有 model.onnx 和 tokenizer.json，dim 为模型输出维度
+    （bge-m3、bge-large-zh 为 1024）。按 token 数动态分批：
+    文本先按长度排序，长度相近的放在同一批，每批只补齐到批内最长文本，
+    批大小受 batch_size 和 max_batch_tokens 共同限制。推理线程数由 threads 控制，
+    max_workers > 1 时多个批次并发推理（onnxruntime 推理时释放 GIL）。
+    """
+
+    def __init__(
+        self,
+        model_dir,
+        batch_size=32,
+        max_workers=1,
+        cache_dir=None,
+        max_length=512,
+        max_batch_tokens=8192,
+        threads=None,
+        dim=1024,
+    ):
+        self.model_dir = model_dir
+        self.max_length = max_length
+        self.max_batch_tokens = max_batch_tokens
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        super().__init__(
+            os.path.basename(os.path.normpath(model_dir)),
+            dim,
+            batch_size,
+            max_workers,
+            cache_dir,
+        )
+
+    def _load(self):
+        """首次使用时加载模型和分词器"""
+        with self._lock:
+            if self._session is None:
+                try:
+                    import onnxruntime
+                    from tokenizers import Tokenizer
+                except ImportError as e:
+                    raise ImportError(
+                        "LocalOnnxEmbedding 需要安装 onnxruntime、tokenizers 和 numpy"
+                    ) from e
+
+                tokenizer = Tokenizer.from_file(
+                    os.path.join(self.model_dir, "tokenizer.json")
+                )
+                tokenizer.enable_truncation(self.max_length)
+                tokenizer.no_padding()
+
+                options = onnxruntime.SessionOptions()
+                if self.threads:
+                    options.intra_op_num_threads = self.threads
+                self._session = onnxruntime.InferenceSession(
+                    os.path.join(self.model_dir, "model.onnx"),
+                    options,
+                    providers=["CPUExecutionProvider"],
+                )
+                self._tokenizer = tokenizer
+        return self._session, self._tokenizer
+
+    def _plan(self, texts, indices):
+        """分词并按长度分批，返回 [(文本编号列表, 对应的编码列表)]；每个文本只分词一次"""
+        _, tokenizer = self._load()
+        encodings = dict(zip(indices, tokenizer.encode_batch([texts[i] for i in indices])))
+
+        plan = []
+        batch = []
+        for i in sorted(indices, key=lambda i: len(encodings[i].ids)):
+            # 已按长度升序排列，加入当前文本后批内最长即为它的长度
+            if batch and (
+                len(batch) >= self.batch_size
+                or (len(batch) + 1) * len(encodings[i].ids) > self.max_batch_tokens
+            ):
+                plan.append((batch, [encodings[j] for j in batch]))
+                batch = []
+            batch.append(i)
+        if batch:
+            plan.append((batch, [encodings[j] for j in batch]))
+        return plan
+
+    def _run(self, encodings):
+        """推理一批已分词的文本，返回 {输出名: 数组}"""
+        import numpy as np
+
+        session, tokenizer = self._load()
+        width = max(len(encoding.ids) for encoding in encodings)
+        pad_id = tokenizer.token_to_id("<pad>") or 0
+        input_ids = np.full((len(encodings), width), pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), width), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, : len(encoding.ids)] = encoding.ids
+            attention_mask[row, : len(encoding.ids)] = 1
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        names = {node.name for node in session.get_inputs()}
+        if "token_type_ids" in names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        with span("embed_batch", texts=len(encodings)) as current:
+            current.set("tokens", int(attention_mask.sum()))
+            current.set("padded_tokens", int(input_ids.size))
+            outputs = session.run(None, {k: v for k, v in feeds.items() if k in names})
+        output_names = [node.name for node in session.get_outputs()]
+        return dict(zip(output_names, outputs))
+
+    def _dense(self, outputs):
+        import numpy as np
+
+        # bge-m3 导出模型直接给出 dense_vecs；否则取 [CLS] 位置的隐藏状态作为句向量
+        output = outputs.get("dense_vecs")
+        if output is None:
+            output = next(iter(outputs.values()))
+        vectors = output[:, 0] if output.ndim == 3 else output
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.astype(np.float32).tolist()
+
+    def _sparse(self, encodings, outputs):
+        """bge-m3 的词权重：每个 token 的权重取出现位置中的最大值，去掉特殊 token"""
+        _, tokenizer = self._load()
+        special = {
+            tokenizer.token_to_id(token) for token in ("<s>", "</s>", "<pad>", "<unk>")
+        }
+        weights = outputs["sparse_vecs"]
+        result = []
+        for row, encoding in enumerate(encodings):
+            sparse = {}
+            for position, token_id in enumerate(encoding.ids):
+                weight = float(weights[row, position].max())
+                if token_id not in special and weight > 0:
+                    sparse[token_id] = max(sparse.get(token_id, 0.0), weight)
+            result.append(sparse)
+        return result
+
+    def _compute(self, texts, indices):
+        plan = self._plan(texts, indices)
+        vectors = self._map(
+            lambda encodings: self._dense(self._run(encodings)),
+            [encodings for _, encodings in plan],
+        )
+        return zip([batch for batch, _ in plan], vectors)
+
+    def _run_hybrid(self, encodings):
+        outputs = self._run(encodings)
+        return self._dense(outputs), self._sparse(encodings, outputs)
+
+    def embed_hybrid(self, texts):
+        """模型带 sparse_vecs 输出（bge-m3）时一次推理同时得到稠密和稀疏向量
+
+        与 embed_documents 一样读写缓存（稀疏向量单独缓存）并按 max_workers 并发推理。
+        """
+        session, _ = self._load()
+        if "sparse_vecs" not in {node.name for node in session.get_outputs()}:
+            return super().embed_hybrid(texts)
+
+        kinds = ("", "sparse")
+        (dense, sparse), missing = self._lookup(texts, kinds)
+        if not missing:
+            return dense, sparse
+        plan = self._plan(texts, missing)
+        results = self._map(self._run_hybrid, [encodings for _, encodings in plan])
+        try:
+            for (batch, _), (vectors, weights) in zip(plan, results):
+                for i, vector, weight in zip(batch, vectors, weights):
+                    dense[i] = vector
+                    sparse[i] = weight
+                self._store(texts, batch, (dense, sparse), kinds)
+        finally:
+            self._sync()
+        return dense, sparse
+
+
+class HashingEmbedding(BaseEmbedding):
+    """确定性的哈希向量：字符 n-gram 特征哈希到 dim 维并归一化
+
+    不需要模型和网络，相同文本总是得到相同向量，字面重叠多的文本相似度更高。
+    适合测试、基准和离线调试，不适合真实检索。
+    """
+
+    def __init__(self, dim=1024, ngram=2, batch_size=256, cache_dir=None):
+        self.ngram = ngram
+        super().__init__(f"hashing-{dim}-{ngram}", dim, batch_size, 1, cache_dir)
+
+    def _embed_one(self, text):
+        vector = [0.0] * self.dim
+        for start in range(max(1, len(text) - self.ngram + 1)):
+            digest = hashlib.blake2b(
+                text[start : start + self.ngram].encode("utf-8"), digest_size=8
+            ).digest()
+            value = int.from_bytes(digest, "little")
+            # 低位决定维度，最高位决定符号，减少哈希冲突带来的偏差
+            vector[value % self.dim] += 1.0 if value >> 63 else -1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def _embed_batch(self, batch_texts):
+        with span("embed_batch", texts=len(batch_texts)):
+            return [self._embed_one(text) for text in batch_texts]
+
+
+# 可选的向量化后端，RAG_EMBEDDING_BACKEND 环境变量或命令行参数选择
+EMBEDDING_BACKENDS = ("openai", "onnx", "hashing")
+
+
+def create_embedding(backend=None, **kwargs):
+    """按名称创建向量化后端，默认读取 RAG_EMBEDDING_BACKEND（缺省为 openai）"""
+    backend = backend or os.environ.get("RAG_EMBEDDING_BACKEND", "openai")
+    if backend == "openai":
+        return OpenAIEmbedding(**kwargs)
+    if backend == "onnx":
+        model_dir = kwargs.pop("model_dir", None) or os.environ.get(
+            "RAG_ONNX_MODEL_DIR"
+        )
+        if not model_dir:
+            raise ValueError("onnx 后端需要设置 RAG_ONNX_MODEL_DIR 或 model_dir")
+        return LocalOnnxEmbedding(model_dir, **kwargs)
+    if backend == "hashing":
+        kwargs.pop("max_workers", None)
+        return HashingEmbedding(**kwargs)
+    raise ValueError(f"未知的向量化后端: {backend}")
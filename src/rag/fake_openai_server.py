@@ -0,0 +1,348 @@
+"""本地模拟的 OpenAI 兼容服务，供基准测试使用
+
+提供 /v1/embeddings、/v1/chat/completions 和 /v1/models，可配置延迟分布和限流。
+向量由文本哈希确定性生成，同一文本总是得到同一向量。
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ANSWER = "B&&这是模拟服务返回的答案。"
+
+
+def fake_embedding(text, dim=1024):
+    """由文本哈希生成单位长度的确定性向量"""
+    data = hashlib.shake_256(text.encode("utf-8")).digest(dim)
+    vector = [(b - 127.5) / 127.5 for b in data]
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class TokenBucket:
+    """每秒 rate 个请求的令牌桶，容量为 burst"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeOpenAIServer:
+    """在后台线程中运行的模拟服务
+
+    延迟 = 基础延迟 + 每条文本延迟 × 条数；latency_sigma > 0 时按对数正态分布
+    抖动（中位数不变）。rate_limit 为每秒请求数，超出时返回 429。
+
+    prefill_ms_per_kchar > 0 时对话首个片段前额外等待提示词的 prefill 时间。
+    prefix_cache=True 时模拟 vLLM 的前缀缓存：提示词按 prefix_block_chars 分块，
+    与之前请求相同的前缀块不再计入 prefill 时间。
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        dim=1024,
+        embed_latency_ms=20.0,
+        per_text_ms=0.5,
+        chat_latency_ms=300.0,
+        stream_chunk_ms=10.0,
+        latency_sigma=0.0,
+        rate_limit=None,
+        answer=DEFAULT_ANSWER,
+        seed=0,
+        prefill_ms_per_kchar=0.0,
+        prefix_cache=False,
+        prefix_block_chars=64,
+        prefix_cache_blocks=100000,
+    ):
+        self.host = host
+        self.port = port
+        self.dim = dim
+        self.embed_latency_ms = embed_latency_ms
+        self.per_text_ms = per_text_ms
+        self.chat_latency_ms = chat_latency_ms
+        self.stream_chunk_ms = stream_chunk_ms
+        self.latency_sigma = latency_sigma
+        self.bucket = TokenBucket(rate_limit) if rate_limit else None
+        self.answer = answer
+        self.random = random.Random(seed)
+        self.prefill_ms_per_kchar = prefill_ms_per_kchar
+        self.prefix_cache = prefix_cache
+        self.prefix_block_chars = prefix_block_chars
+        self.prefix_cache_blocks = prefix_cache_blocks
+        self._prefix_blocks = OrderedDict()
+        self.stats = {
+            "embeddings": 0,
+            "chat": 0,
+            "rate_limited": 0,
+            "prompt_chars": 0,
+            "cached_prompt_chars": 0,
+        }
+        self._stats_lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def sample_latency(self, median_ms):
+        """按配置的分布采样一次延迟（秒）"""
+        if self.latency_sigma > 0:
+            median_ms *= math.exp(self.random.gauss(0, self.latency_sigma))
+        return median_ms / 1000
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def reset_prefix_cache(self):
+        with self._stats_lock:
+            self._prefix_blocks.clear()
+
+    def prefill_latency(self, body):
+        """提示词的 prefill 时间（秒），开启前缀缓存时扣除命中的前缀块"""
+        prompt = "".join(
+            f"<{m.get('role')}>{m.get('content') or ''}" for m in body["messages"]
+        )
+        size = self.prefix_block_chars
+        cached = 0
+        if self.prefix_cache:
+            # 每块的键是从开头到该块的累积哈希，只有整个前缀相同才能命中
+            digest = hashlib.blake2b(digest_size=16)
+            keys = []
+            for start in range(0, len(prompt) - size + 1, size):
+                digest.update(prompt[start : start + size].encode("utf-8"))
+                keys.append(digest.digest())
+            with self._stats_lock:
+                for key in keys:
+                    if key not in self._prefix_blocks:
+                        break
+                    cached += size
+                for key in keys:
+                    self._prefix_blocks[key] = True
+                    self._prefix_blocks.move_to_end(key)
+                while len(self._prefix_blocks) > self.prefix_cache_blocks:
+                    self._prefix_blocks.popitem(last=False)
+        self._count("prompt_chars", len(prompt))
+        self._count("cached_prompt_chars", cached)
+        return (len(prompt) - cached) / 1000 * self.prefill_ms_per_kchar / 1000
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def embeddings(self, body):
+        texts = body["input"]
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(
+            self.sample_latency(self.embed_latency_ms + self.per_text_ms * len(texts))
+        )
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(text, self.dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(
+                    struct.pack(f"<{len(vector)}f", *vector)
+                ).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(text) for text in texts)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def chat(self, body):
+        time.sleep(
+            self.sample_latency(self.chat_latency_ms) + self.prefill_latency(body)
+        )
+        prompt_tokens = sum(len(m.get("content") or "") for m in body["messages"])
+        completion_tokens = len(self.answer)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.answer},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def chat_stream(self, body):
+        """流式响应：首个片段前等待 chat_latency_ms 和 prefill 时间，之后逐字产出"""
+        time.sleep(
+            self.sample_latency(self.chat_latency_ms) + self.prefill_latency(body)
+        )
+        created = int(time.time())
+        for char in self.answer:
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": body.get("model", "fake-model"),
+                "choices": [
+                    {"index": 0, "delta": {"content": char}, "finish_reason": None}
+                ],
+            }
+            yield json.dumps(chunk, ensure_ascii=False)
+            time.sleep(self.stream_chunk_ms / 1000)
+        yield "[DONE]"
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, events):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for event in events:
+                data = f"data: {event}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(
+                    200,
+                    {"object": "list", "data": [{"id": "fake-model", "object": "model"}]},
+                )
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if server.bucket is not None and not server.bucket.acquire():
+                server._count("rate_limited")
+                self._send_json(
+                    429,
+                    {"error": {"message": "rate limited", "type": "rate_limit_error"}},
+                    {"Retry-After": "0.1"},
+                )
+            elif self.path.endswith("/embeddings"):
+                server._count("embeddings")
+                self._send_json(200, server.embeddings(body))
+            elif self.path.endswith("/chat/completions"):
+                server._count("chat")
+                if body.get("stream"):
+                    self._send_stream(server.chat_stream(body))
+                else:
+                    self._send_json(200, server.chat(body))
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的 OpenAI 兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--per-text-ms", type=float, default=0.5)
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0)
+    parser.add_argument(
+        "--latency-sigma", type=float, default=0.0, help="对数正态抖动，0 为固定延迟"
+    )
+    parser.add_argument("--rate-limit", type=float, help="每秒请求数上限，超出返回 429")
+    parser.add_argument(
+        "--prefill-ms-per-kchar",
+        type=float,
+        default=0.0,
+        help="每千字符提示词的 prefill 时间",
+    )
+    parser.add_argument(
+        "--prefix-cache", action="store_true", help="模拟前缀缓存，命中的前缀不计 prefill"
+    )
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        host=args.host,
+        port=args.port,
+        dim=args.dim,
+        embed_latency_ms=args.embed_latency_ms,
+        per_text_ms=args.per_text_ms,
+        chat_latency_ms=args.chat_latency_ms,
+        latency_sigma=args.latency_sigma,
+        rate_limit=args.rate_limit,
+        prefill_ms_per_kchar=args.prefill_ms_per_kchar,
+        prefix_cache=args.prefix_cache,
+    ).start()
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""知识库热更新：后台发现新版本、预热后原子切换，旧版本在检索排空后释放"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+
+class IndexHandle:
+    """一个上线中的集合版本，引用计数记录正在使用它的检索
+
+    retire() 之后不再有新的检索进入；最后一个检索结束时调用 on_drained 释放资源。
+    """
+
+    def __init__(self, collection_name, on_drained=None):
+        self.collection_name = collection_name
+        self.on_drained = on_drained
+        self.refs = 0
+        self.retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self.refs -= 1
+            drained = self.retired and self.refs == 0
+        if drained:
+            self._drained()
+
+    def retire(self):
+        with self._lock:
+            self.retired = True
+            drained = self.refs == 0
+        if drained:
+            self._drained()
+
+    def _drained(self):
+        if self.on_drained is not None:
+            self.on_drained(self.collection_name)
+
+
+class RetrievalCache:
+    """检索结果（或答案）的 LRU 缓存，键包含集合名，切换版本后按集合名整体失效"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name):
+        """删除某个集合版本的全部缓存（键的第一项为集合名）"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == collection_name]:
+                del self._entries[key]
+
+
+class IndexWatcher:
+    """后台线程定期检查别名指向的版本，发现变化后预热新版本再切换"""
+
+    def __init__(self, rag_system, interval=5.0):
+        self.rag_system = rag_system
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def check(self):
+        """检查一次，发生切换时返回新集合名"""
+        rag_system = self.rag_system
+        target = rag_system.registry.resolve(rag_system.alias)
+        if target == rag_system.active_collection:
+            return None
+        logging.info(f"发现知识库新版本 {target}，开始预热")
+        rag_system.warm_up(target)
+        rag_system.switch_index(target)
+        return target
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                # 预热失败时保持旧版本继续服务，下一轮重试
+                logging.exception("知识库热更新失败")
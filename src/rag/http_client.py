@@ -0,0 +1,177 @@
+"""向量服务和 LLM 共用的 HTTP 连接池
+
+所有 OpenAI 兼容请求共用一个 httpx.Client：长连接复用、可选 HTTP/2、统一超时，
+并按接口（embeddings、chat/completions）限制并发，连续失败时熔断，快速失败而不是
+继续堆积请求。httpx 随 openai 安装，同样在首次使用时再导入。
+"""
+
+import os
+import threading
+import time
+
+from dotenv import load_dotenv, find_dotenv
+
+_ = load_dotenv(find_dotenv())
+
+# 每个接口的最大并发请求数，可用环境变量覆盖
+ENDPOINT_LIMITS = {
+    "embeddings": int(os.environ.get("RAG_EMBEDDING_CONCURRENCY", "8")),
+    "chat/completions": int(os.environ.get("RAG_CHAT_CONCURRENCY", "16")),
+}
+# 连续失败多少次后熔断，熔断多少秒后放行一个试探请求
+BREAKER_THRESHOLD = int(os.environ.get("RAG_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("RAG_BREAKER_RESET_SECONDS", "30"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def api_settings():
+    """返回 (api_key, base_url)
+
+    统一使用 OPENAI_BASE_URL，兼容旧的 OPENAI_API_BASE。
+    """
+    base_url = os.environ.get("OPENAI_BASE_URL") or os.environ.get("OPENAI_API_BASE")
+    return os.environ.get("OPENAI_API_KEY"), base_url
+
+
+def endpoint_name(path):
+    """请求路径对应的接口名，如 /v1/chat/completions -> chat/completions"""
+    for name in ENDPOINT_LIMITS:
+        if path.rstrip("/").endswith(name):
+            return name
+    return path
+
+
+class CircuitBreaker:
+    """连续失败 threshold 次后熔断 reset_seconds 秒，之后放行一个试探请求"""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.probing = True
+            return True
+
+    def record(self, success):
+        with self.lock:
+            self.probing = False
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+def _create_client():
+    import httpx
+
+    class CircuitOpenError(httpx.TransportError):
+        """熔断期间直接拒绝请求"""
+
+    class ReleasingStream(httpx.SyncByteStream):
+        """响应体读完（或关闭）时才释放并发名额，流式响应也被计入"""
+
+        def __init__(self, stream, release):
+            self.stream = stream
+            self.release = release
+
+        def __iter__(self):
+            yield from self.stream
+
+        def close(self):
+            try:
+                self.stream.close()
+            finally:
+                self.release()
+
+    class LimitedTransport(httpx.BaseTransport):
+        def __init__(self, transport):
+            self.transport = transport
+            self.semaphores = {
+                name: threading.BoundedSemaphore(limit)
+                for name, limit in ENDPOINT_LIMITS.items()
+            }
+            self.breakers = {name: CircuitBreaker() for name in ENDPOINT_LIMITS}
+
+        def handle_request(self, request):
+            name = endpoint_name(request.url.path)
+            semaphore = self.semaphores.get(name)
+            breaker = self.breakers.get(name)
+            if breaker is not None and not breaker.allow():
+                raise CircuitOpenError(f"circuit open for {name}", request=request)
+
+            if semaphore is not None:
+                semaphore.acquire()
+            released = threading.Event()
+
+            def release():
+                if semaphore is not None and not released.is_set():
+                    released.set()
+                    semaphore.release()
+
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                release()
+                if breaker is not None:
+                    breaker.record(False)
+                raise
+            if breaker is not None:
+                # 429 是对方限流，不代表服务故障
+                breaker.record(response.status_code < 500)
+            response.stream = ReleasingStream(response.stream, release)
+            return response
+
+        def close(self):
+            self.transport.close()
+
+    http2 = os.environ.get("RAG_HTTP2", "").lower() in ("1", "true")
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=sum(ENDPOINT_LIMITS.values()),
+        max_keepalive_connections=sum(ENDPOINT_LIMITS.values()),
+        keepalive_expiry=60,
+    )
+    transport = httpx.HTTPTransport(limits=limits, http2=http2, retries=1)
+    return httpx.Client(
+        transport=LimitedTransport(transport),
+        timeout=httpx.Timeout(
+            float(os.environ.get("RAG_HTTP_TIMEOUT", "60")), connect=5.0
+        ),
+    )
+
+
+def shared_http_client():
+    """进程内共享的 httpx.Client，首次调用时创建"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def create_openai_client():
+    """使用共享连接池创建 OpenAI 客户端"""
+    from openai import OpenAI
+
+    api_key, base_url = api_settings()
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=shared_http_client())
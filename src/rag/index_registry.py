@@ -0,0 +1,166 @@
+"""知识库集合的版本管理
+
+每次重建知识库都写入一个新的带版本号的集合（如 rag_collection_v3），构建完成后
+再把别名切换过去，查询始终通过别名解析到当前上线的集合，重建期间不影响查询。
+版本信息和别名记录在数据库旁的清单文件中，先写临时文件再替换，切换是原子的。
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_ALIAS = "rag_collection"
+# Milvus 服务没有本地数据库文件，状态文件放在默认数据库目录下，按服务地址命名
+SERVER_STATE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "data_base",
+    "vector_db",
+)
+
+
+def is_milvus_server(uri):
+    """uri 是 Milvus 服务地址（如 http://localhost:19530），而不是 Milvus Lite 的本地文件
+
+    Milvus Lite 同一时间只允许一个进程打开数据库文件，多个进程共用知识库时需要使用 Milvus 服务。
+    """
+    return "://" in uri
+
+
+def state_prefix(persist_dir):
+    """数据库旁的状态文件（版本清单、题库索引）的路径前缀"""
+    if is_milvus_server(persist_dir):
+        return os.path.join(SERVER_STATE_DIR, re.sub(r"[^\w.-]+", "_", persist_dir))
+    return os.path.splitext(persist_dir)[0]
+
+
+def manifest_path(persist_dir):
+    return f"{state_prefix(persist_dir)}_collections.json"
+
+
+class CollectionRegistry:
+    """集合版本清单：{"aliases": {别名: 集合名}, "versions": {集合名: 元数据}}"""
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._mtime = None
+
+    def _load(self):
+        """读取清单，文件被其他进程更新后自动重新加载"""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except FileNotFoundError:
+            mtime = None
+        if self._manifest is None or mtime != self._mtime:
+            if mtime is None:
+                self._manifest = {"aliases": {}, "versions": {}}
+            else:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            self._mtime = mtime
+        return self._manifest
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        self._mtime = os.path.getmtime(self.manifest_path)
+
+    def resolve(self, alias=DEFAULT_ALIAS):
+        """别名对应的上线集合；清单中没有该别名时（旧知识库）直接使用别名作为集合名"""
+        with self._lock:
+            return self._load()["aliases"].get(alias, alias)
+
+    def versions(self, alias=DEFAULT_ALIAS):
+        """别名下的全部版本，按版本号升序"""
+        with self._lock:
+            versions = self._load()["versions"].values()
+            return sorted(
+                (v for v in versions if v["alias"] == alias),
+                key=lambda v: v["version"],
+            )
+
+    def get(self, name):
+        """集合版本的元数据，未登记时返回 None"""
+        with self._lock:
+            return self._load()["versions"].get(name)
+
+    def new_version(self, alias=DEFAULT_ALIAS, **metadata):
+        """登记一个待构建的新版本，返回集合名"""
+        with self._lock:
+            manifest = self._load()
+            existing = [
+                v["version"] for v in manifest["versions"].values() if v["alias"] == alias
+            ]
+            version = max(existing, default=0) + 1
+            name = f"{alias}_v{version}"
+            manifest["versions"][name] = {
+                "name": name,
+                "alias": alias,
+                "version": version,
+                "status": "building",
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                **metadata,
+            }
+            self._save()
+            return name
+
+    def update(self, name, **metadata):
+        """更新已登记版本的元数据"""
+        with self._lock:
+            manifest = self._load()
+            if name not in manifest["versions"]:
+                raise KeyError(f"collection {name} is not registered")
+            manifest["versions"][name].update(metadata)
+            self._save()
+
+    def activate(self, name):
+        """将版本所属别名原子地切换到该版本，原上线版本标记为 retired"""
+        with self._lock:
+            manifest = self._load()
+            if name not in manifest["versions"]:
+                raise KeyError(f"collection {name} is not registered")
+            entry = manifest["versions"][name]
+            previous = manifest["aliases"].get(entry["alias"])
+            if previous in manifest["versions"] and previous != name:
+                manifest["versions"][previous]["status"] = "retired"
+            entry["status"] = "live"
+            entry["activated_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            manifest["aliases"][entry["alias"]] = name
+            self._save()
+
+    def mark_failed(self, name):
+        with self._lock:
+            manifest = self._load()
+            if name in manifest["versions"]:
+                manifest["versions"][name]["status"] = "failed"
+                self._save()
+
+    def garbage(self, alias=DEFAULT_ALIAS, keep=1):
+        """可回收的版本
+
+        只保留最新的 keep 个已下线版本（用于回滚）；失败的构建，以及比上线版本更旧、
+        仍处于 building 状态（构建进程中断）的版本全部回收。上线版本永不回收。
+        """
+        versions = self.versions(alias)
+        live = self.resolve(alias)
+        live_version = next((v["version"] for v in versions if v["name"] == live), 0)
+        retired = [v for v in versions if v["status"] == "retired"]
+        stale = retired[: max(0, len(retired) - keep)]
+        stale += [
+            v
+            for v in versions
+            if v["status"] == "failed"
+            or (v["status"] == "building" and v["version"] < live_version)
+        ]
+        return [v["name"] for v in stale]
+
+    def remove(self, name):
+        with self._lock:
+            manifest = self._load()
+            manifest["versions"].pop(name, None)
+            self._save()
@@ -1,37 +1,83 @@
 import os
-from openai import OpenAI
+import logging
 from dotenv import load_dotenv, find_dotenv
+from http_client import api_settings, create_openai_client
+from telemetry import should_log_prompt, span
+
+# 提示词中固定不变的部分全部放在系统消息里，每次请求的前缀逐字节相同，
+# vLLM 等服务开启前缀缓存后可复用这部分的 KV cache
+SYSTEM_PROMPT = (
+    "你是一个问答机器人，请根据提供的背景知识回答问题。\n"
+    "用户消息先给出若干段背景知识，每段以“【资料】”开头，最后以“问题：”给出问题。"
+)
+
+
+def format_context(context):
+    """背景知识拼接为固定格式；调用方负责按规范顺序排列（见 RAGSystem._build_context）"""
+    return "\n\n".join(f"【资料】\n{text.strip()}" for text in context)
 
 
 class LLMClient:
     def __init__(self):
         load_dotenv(find_dotenv())
-        api_key = os.getenv("OPENAI_API_KEY")
-        base_url = os.getenv("OPENAI_API_BASE")
+        api_key, base_url = api_settings()
         self.model_name = os.getenv("LLM_MODEL_NAME", "Qwen/Qwen3-8B")
 
         if not api_key:
             raise ValueError("OPENAI_API_KEY is not set in the environment variables.")
 
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    @property
+    def client(self):
+        """首次调用时再创建 OpenAI 客户端（openai 包导入较慢），与向量服务共用连接池"""
+        if self._client is None:
+            self._client = create_openai_client()
+        return self._client
+
+    def _messages(self, question, context):
+        # 变化的部分按 背景知识 -> 问题 的顺序放在最后，相同的背景知识也能共享前缀
+        prompt = f"{format_context(context)}\n\n问题：{question.strip()}"
+        # 完整 prompt 很长，只按 RAG_PROMPT_LOG_RATE 采样记录
+        if should_log_prompt():
+            logging.info(f"LLM Input: {prompt}")
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
 
     def generate_answer(self, question, context):
         """
         Generates an answer using the LLM based on the provided question and context.
         """
-        context_str = "\n\n".join(context)
-        prompt = f"请根据以下提供的知识回答问题：\n\n{context_str}\n\n问题：{question}"
-        print(f"LLM Input: {prompt}")
-
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一个问答机器人，请根据提供的背景知识回答问题。",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-        )
+        messages = self._messages(question, context)
+        with span("generate", contexts=len(context)) as current:
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.7,
+            )
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                current.set("prompt_tokens", usage.prompt_tokens)
+                current.set("completion_tokens", usage.completion_tokens)
         return response.choices[0].message.content
+
+    def stream_answer(self, question, context):
+        """流式生成答案，逐段产出文本"""
+        messages = self._messages(question, context)
+        with span("generate", contexts=len(context)) as current:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                temperature=0.7,
+                stream=True,
+            )
+            chunks = 0
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks += 1
+                    yield chunk.choices[0].delta.content
+            current.set("stream_chunks", chunks)
@@ -0,0 +1,156 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+
+QUESTION_COLLECTION = "question_bank"
+# .qbank 题库的读取模块（question_store.py）位于 src/preprocess
+PREPROCESS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "preprocess"
+)
+
+# 去掉题干开头的题号，如 "12. "、"3、"
+_QUESTION_NUMBER = re.compile(r"^\s*\d+\s*[.．、]\s*")
+_IGNORED_CHARS = re.compile(r"[\s，。、；：,.;:？?！!（）()“”\"'‘’]+")
+
+
+def load_questions(path, fields=None):
+    """读取题库文件，兼容 JSON 数组、JSONL 和 .qbank 三种格式
+
+    fields 只对 .qbank 生效，只解码指定的字段。
+    """
+    if path.endswith(".qbank"):
+        if PREPROCESS_DIR not in sys.path:
+            sys.path.insert(0, PREPROCESS_DIR)
+        from question_store import QuestionStore
+
+        with QuestionStore(path) as store:
+            return list(store.select(range(len(store)), fields))
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def normalize_question(text):
+    """归一化题干：去掉题号、空白和标点，用于精确查重"""
+    return _IGNORED_CHARS.sub("", _QUESTION_NUMBER.sub("", text)).lower()
+
+
+def question_hash(question, options=None):
+    """题干（可选加上选项）的哈希，题干相同但选项不同的题目不视为重复"""
+    key = normalize_question(question)
+    if options:
+        key += "|" + "|".join(
+            normalize_question(options[letter]) for letter in sorted(options)
+        )
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def format_question(item, with_answer=False):
+    """将题目格式化为文本：题干 + 选项 (+ 答案) + 解析"""
+    lines = [item["question"]]
+    lines.extend(f"{letter}. {text}" for letter, text in item.get("options", {}).items())
+    if with_answer and item.get("answer"):
+        lines.append(f"答案：{item['answer']}")
+    if item.get("analysis"):
+        lines.append(f"解析：{item['analysis']}")
+    return "\n".join(lines)
+
+
+class QuestionBank:
+    """题库检索：相似题向量检索 + 基于哈希的精确查重"""
+
+    def __init__(self, vector_db, index_path, collection_name=QUESTION_COLLECTION):
+        self.vector_db = vector_db
+        self.index_path = index_path
+        self.collection_name = collection_name
+        self._exact = None
+
+    @property
+    def exact_index(self):
+        """题干哈希 -> 题目记录，首次使用时从磁盘加载"""
+        if self._exact is None:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._exact = json.load(f)
+            else:
+                self._exact = {}
+        return self._exact
+
+    def build(self, file_paths):
+        """从题库文件构建相似题集合和精确查重索引，返回入库题目数"""
+        from langchain.docstore.document import Document
+
+        exact = {}
+        seen = set()
+        documents = []
+        duplicates = 0
+        for path in file_paths:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for index, item in enumerate(load_questions(path), start=1):
+                full_hash = question_hash(item["question"], item.get("options"))
+                if full_hash in seen:
+                    duplicates += 1
+                    continue
+                seen.add(full_hash)
+
+                # 题号在不同文件、不同章节间会重复，编号加上文件名前缀
+                question_id = f"{stem}:{item.get('question_id', index)}"
+                record = {
+                    "question_id": question_id,
+                    "question": item["question"],
+                    "options": item.get("options", {}),
+                    "answer": item.get("answer", ""),
+                    "analysis": item.get("analysis", ""),
+                }
+                exact.setdefault(question_hash(item["question"]), record)
+                documents.append(
+                    Document(
+                        page_content=format_question(item),
+                        metadata={
+                            "question_id": question_id,
+                            "answer": record["answer"],
+                            "subject_category": item.get("subject_category", ""),
+                            "source": os.path.basename(path),
+                        },
+                    )
+                )
+
+        logging.info(f"题库共 {len(documents)} 道题，跳过 {duplicates} 道重复题")
+        self.vector_db.create_from_documents(
+            documents, collection_name=self.collection_name
+        )
+
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(exact, f, ensure_ascii=False)
+        self._exact = exact
+        return len(documents)
+
+    def find_exact(self, question):
+        """按题干精确查找题库中的原题，找不到时返回 None"""
+        return self.exact_index.get(question_hash(question))
+
+    def similar(self, question, k=3):
+        """检索最相似的 k 道题"""
+        return self.vector_db.similarity_search(
+            question, k=k, collection_name=self.collection_name
+        )
+
+    def examples(self, question, k=3):
+        """为问题准备附带答案的例题：精确命中的原题优先，其余用相似题补足"""
+        examples = []
+        match = self.find_exact(question)
+        if match:
+            examples.append(format_question(match, with_answer=True))
+        if k > len(examples):
+            for doc in self.similar(question, k=k):
+                if match and doc.metadata.get("question_id") == match["question_id"]:
+                    continue
+                if len(examples) < k:
+                    examples.append(
+                        f"{doc.page_content}\n答案：{doc.metadata.get('answer', '')}"
+                    )
+        return examples
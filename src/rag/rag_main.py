@@ -1,9 +1,23 @@
 import os
+import shutil
 import logging
+import threading
 from dotenv import load_dotenv, find_dotenv
-from document_processor import DocumentProcessor
 from vector_db import VectorDatabase
 from llm_apis import LLMClient
+from chunk_store import INDEX_FILE, ChunkStore, append_chunks, write_chunks
+from telemetry import span
+from question_bank import QuestionBank, format_question, normalize_question
+from singleflight import SingleFlight
+from index_registry import (
+    DEFAULT_ALIAS,
+    CollectionRegistry,
+    is_milvus_server,
+    manifest_path,
+    state_prefix,
+)
+from hot_reload import IndexHandle, IndexWatcher, RetrievalCache
+import adaptive_k
 
 # 配置日志记录
 logging.basicConfig(
@@ -14,105 +28,411 @@ logging.basicConfig(
 load_dotenv(find_dotenv())
 
 
+# 项目根目录
+PROJECT_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+def list_files(data_dir):
+    """获取目录下所有文档路径"""
+    return [
+        os.path.join(root, file) for root, _, files in os.walk(data_dir) for file in files
+    ]
+
+
+def _canonical_order(doc):
+    chunk_id = doc.metadata.get("chunk_id")
+    return (chunk_id is None, chunk_id if chunk_id is not None else 0, doc.page_content)
+
+
 class RAGSystem:
-    def __init__(self, persist_dir, strategy="default"):
+    def __init__(
+        self,
+        persist_dir,
+        strategy="default",
+        cross_page=False,
+        dedup_threshold=None,
+        chunk_size=500,
+        chunk_overlap=50,
+        index_type="FLAT",
+        output_dir=None,
+        embedding=None,
+        sparse=False,
+        alias=DEFAULT_ALIAS,
+        cache_size=256,
+        adaptive_band=adaptive_k.DEFAULT_BAND,
+    ):
         self.strategy = strategy
-        self.document_processor = DocumentProcessor(strategy=self.strategy)
-        self.vector_db = VectorDatabase(persist_directory=persist_dir)
+        self.cross_page = cross_page
+        self.dedup_threshold = dedup_threshold
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.index_type = index_type
+        # 构建时同时存储稀疏向量，检索时自动使用稠密 + 稀疏混合检索
+        self.sparse = sparse
+        # 切割结果保存目录，默认 output/<strategy>；每个集合版本写入其下以集合名命名的子目录
+        self.output_dir = output_dir or os.path.join(PROJECT_DIR, "output", strategy)
+        self._document_processor = None
+        self.vector_db = VectorDatabase(embedding=embedding, persist_directory=persist_dir)
         self.llm_client = LLMClient()
         self.persist_dir = persist_dir
+        self.question_bank = QuestionBank(
+            self.vector_db, f"{state_prefix(persist_dir)}_questions.json"
+        )
+        # 正在执行的查询，用于合并相同的并发问题
+        self._inflight = SingleFlight()
+        # 知识库集合按版本构建，查询通过别名解析到当前上线的版本
+        self.alias = alias
+        self.registry = CollectionRegistry(manifest_path(persist_dir))
+        # 当前服务查询的版本；切换时旧版本等正在进行的检索结束后再释放
+        self._handle = None
+        self._handle_lock = threading.Lock()
+        self._watcher = None
+        # 检索结果缓存，键包含集合名，版本切换后自动失效
+        self.retrieval_cache = RetrievalCache(cache_size)
+        # 自适应模式下缓存生成的答案，命中时跳过检索和生成
+        self.answer_cache = RetrievalCache(cache_size)
+        # 自适应检索保留与第一名分数的相对差距不超过该比例的文档块
+        self.adaptive_band = adaptive_band
+
+    @property
+    def document_processor(self):
+        """文档处理依赖（langchain 加载器、PyMuPDF 等）只在构建知识库时导入"""
+        if self._document_processor is None:
+            from document_processor import DocumentProcessor
+
+            self._document_processor = DocumentProcessor(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                strategy=self.strategy,
+                cross_page=self.cross_page,
+                dedup_threshold=self.dedup_threshold,
+            )
+        return self._document_processor
 
-    def build_knowledge_base(self, data_dir):
-        """构建知识库"""
-        if len(os.listdir(os.path.dirname(self.persist_dir))) > 0:
+    def build_knowledge_base(self, data_dir, force=False):
+        """构建知识库，force=True 时即使已存在也重新构建"""
+        if is_milvus_server(self.persist_dir):
+            exists = bool(self.registry.versions(self.alias))
+        else:
+            exists = len(os.listdir(os.path.dirname(self.persist_dir))) > 0
+        if not force and exists:
             logging.info("知识库已存在，跳过构建。")
             return
-        # 获取所有文档路径
-        file_paths = [
-            os.path.join(root, file)
-            for root, _, files in os.walk(data_dir)
-            for file in files
-        ]
 
         # 处理文档
-        processed_docs = self.document_processor.process_documents(file_paths)
-
-        # 保存处理后的文档以供检查
-        output_dir = os.path.join(
-            os.path.dirname(
-                os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            ),
-            "output",
-            self.strategy,
+        processed_docs = self.document_processor.process_documents(list_files(data_dir))
+
+        # 构建新版本的集合，完成后再切换别名，构建期间查询仍使用旧版本
+        embedding = self.vector_db.embedding
+        collection_name = self.registry.new_version(
+            self.alias,
+            strategy=self.strategy,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            model=getattr(embedding, "model", type(embedding).__name__),
+            sparse=self.sparse,
         )
+        # 文档块编号与集合版本一一对应，每个版本写入自己的目录，不覆盖上线版本的文档块
+        chunks_dir = os.path.abspath(os.path.join(self.output_dir, collection_name))
+        try:
+            self.registry.update(collection_name, output_dir=chunks_dir)
 
-        # Clear existing files in the directory
-        if os.path.exists(output_dir):
-            for root, dirs, files in os.walk(output_dir, topdown=False):
-                for name in files:
-                    os.remove(os.path.join(root, name))
-                for name in dirs:
-                    os.rmdir(os.path.join(root, name))
+            # 所有文档块顺序写入单个 JSONL 文件，并附带偏移索引
+            with span("write_chunks"):
+                chunks_path = write_chunks(processed_docs, chunks_dir)
+            logging.info(f"切割后的文档已保存到 {chunks_path}")
 
-        os.makedirs(output_dir, exist_ok=True)
+            self.vector_db.create_from_documents(
+                processed_docs,
+                collection_name=collection_name,
+                index_type=self.index_type,
+                sparse=self.sparse,
+            )
+        except Exception:
+            self.registry.mark_failed(collection_name)
+            raise
+        self.registry.activate(collection_name)
+        self.switch_index(collection_name)
+        logging.info(
+            f"知识库构建完成，{self.alias} -> {collection_name}，包含 "
+            f"{self.vector_db.get_collection_count(collection_name)} 个文档块"
+        )
+
+    def chunks_dir(self, collection_name=None):
+        """集合版本（默认为上线版本）的文档块目录；清单中没有记录时（旧知识库）使用 output_dir"""
+        version = self.registry.get(
+            collection_name or self.registry.resolve(self.alias)
+        )
+        if version and version.get("output_dir"):
+            return version["output_dir"]
+        return self.output_dir
+
+    def update_knowledge_base(self, data_dir):
+        """增量更新知识库：只处理上线版本文档块文件中尚未收录的新文档，返回新增块数"""
+        collection_name = self.registry.resolve(self.alias)
+        chunks_dir = self.chunks_dir(collection_name)
+        known = set()
+        if os.path.exists(os.path.join(chunks_dir, INDEX_FILE)):
+            known = set(ChunkStore(chunks_dir).sources)
+        new_files = [
+            path for path in list_files(data_dir) if os.path.basename(path) not in known
+        ]
+        if not new_files:
+            logging.info("没有新文档，无需更新。")
+            return 0
+
+        logging.info(f"发现 {len(new_files)} 个新文档")
+        processed_docs = self.document_processor.process_documents(new_files)
+        with span("write_chunks"):
+            append_chunks(processed_docs, chunks_dir)
+        self.vector_db.add_documents(processed_docs, collection_name=collection_name)
+        self.retrieval_cache.invalidate(collection_name)
+        self.answer_cache.invalidate(collection_name)
+        logging.info(
+            f"知识库更新完成，新增 {len(processed_docs)} 个文档块，"
+            f"共 {self.vector_db.get_collection_count(collection_name)} 个"
+        )
+        return len(processed_docs)
+
+    def collect_garbage(self, keep=1):
+        """删除不再需要的旧版本集合，保留最新的 keep 个已下线版本用于回滚"""
+        dropped = [
+            name
+            for name in self.registry.garbage(self.alias, keep=keep)
+            if name != self.active_collection
+        ]
+        for name in dropped:
+            self.vector_db.drop_collection(name)
+            chunks_dir = self.chunks_dir(name)
+            # 只删除该版本自己的文档块目录，旧知识库共用的 output_dir 保留
+            if os.path.basename(os.path.normpath(chunks_dir)) == name:
+                shutil.rmtree(chunks_dir, ignore_errors=True)
+            self.registry.remove(name)
+            logging.info(f"已删除旧版本集合 {name}")
+        return dropped
 
-        for doc in processed_docs:
-            source_filename = os.path.basename(
-                doc.metadata.get("source", "unknown_file")
+    def build_question_bank(self, question_files):
+        """构建题库检索集合，用于检索相似例题"""
+        count = self.question_bank.build(question_files)
+        logging.info(f"题库构建完成，包含 {count} 道题")
+
+    def _current_handle(self):
+        """调用方需持有 _handle_lock；首次使用时按别名解析上线版本"""
+        if self._handle is None:
+            self._handle = IndexHandle(
+                self.registry.resolve(self.alias), self._release_collection
             )
-            filename_base, _ = os.path.splitext(source_filename)
+        return self._handle
 
-            file_output_dir = os.path.join(output_dir, filename_base)
-            os.makedirs(file_output_dir, exist_ok=True)
+    def _refresh_index(self):
+        """没有后台线程时每次检索都按别名解析，其他进程切换版本后立即生效
 
-            # Find the next available chunk number
-            chunk_num = 1
-            while os.path.exists(
-                os.path.join(file_output_dir, f"chunk_{chunk_num}.txt")
-            ):
-                chunk_num += 1
+        清单按修改时间缓存，未变化时只需一次 stat。
+        """
+        if self._watcher is None:
+            self.switch_index(self.registry.resolve(self.alias))
 
-            with open(
-                os.path.join(file_output_dir, f"chunk_{chunk_num}.txt"),
-                "w",
-                encoding="utf-8",
-            ) as f:
-                f.write(doc.page_content)
+    @property
+    def active_collection(self):
+        """当前服务查询的集合名"""
+        self._refresh_index()
+        with self._handle_lock:
+            return self._current_handle().collection_name
 
-        logging.info(f"切割后的文档已保存到 {output_dir}")
+    def _acquire_index(self):
+        self._refresh_index()
+        # 在锁内增加引用计数，保证切换时不会漏掉刚开始的检索
+        with self._handle_lock:
+            return self._current_handle().acquire()
 
-        # 构建向量数据库
-        self.vector_db.create_from_documents(processed_docs)
-        logging.info(
-            f"知识库构建完成，包含 {self.vector_db.get_collection_count()} 个文档块"
+    def _release_collection(self, collection_name):
+        """旧版本上的检索全部结束后释放其内存和缓存"""
+        self.retrieval_cache.invalidate(collection_name)
+        self.answer_cache.invalidate(collection_name)
+        try:
+            self.vector_db.release_collection(collection_name)
+        except Exception as e:
+            logging.warning(f"释放集合 {collection_name} 失败: {e}")
+        logging.info(f"旧版本集合 {collection_name} 已排空并释放")
+
+    def warm_up(self, collection_name):
+        """预先加载集合并执行一次检索，切换后的第一个查询不必等待加载"""
+        if not self.vector_db.vectordb:
+            self.vector_db.load_existing(self.persist_dir)
+        self.vector_db.load_collection(collection_name)
+        self._search_collection(collection_name, "预热", 1)
+
+    def switch_index(self, collection_name):
+        """原子地切换到新版本，新检索立即使用新版本，旧版本排空后释放"""
+        with self._handle_lock:
+            old = self._handle
+            if old is not None and old.collection_name == collection_name:
+                return
+            self._handle = IndexHandle(collection_name, self._release_collection)
+        if old is not None:
+            logging.info(f"知识库切换: {old.collection_name} -> {collection_name}")
+            old.retire()
+
+    def start_watcher(self, interval=5.0):
+        """启动后台线程，发现别名指向新版本时自动预热并切换
+
+        由其他进程构建新版本时需要使用 Milvus 服务，Milvus Lite 不允许两个进程同时打开数据库文件。
+        """
+        if not is_milvus_server(self.persist_dir):
+            logging.warning(
+                "Milvus Lite 不支持多个进程同时打开数据库文件，"
+                "由其他进程构建或切换版本时请使用 Milvus 服务地址"
+            )
+        if self._watcher is None:
+            self._watcher = IndexWatcher(self, interval).start()
+        return self._watcher
+
+    def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _search_collection(self, collection_name, question, k):
+        if self.vector_db.has_sparse(collection_name):
+            return self.vector_db.hybrid_search(
+                question, k=k, collection_name=collection_name
+            )
+        return self.vector_db.similarity_search(
+            question, k=k, collection_name=collection_name
         )
 
-    def query(self, question, k=3):
-        """查询知识库并生成答案"""
-        if not os.path.exists(self.persist_dir):
+    def search(self, question, k=3, adaptive=False):
+        """只检索，不生成答案；相同问题的检索结果在当前版本内缓存
+
+        adaptive=True 时检索 2k 个候选，按分数分布保留其中一部分：第一名明显领先时
+        只保留它，分数接近时最多保留全部候选。
+        """
+        if not is_milvus_server(self.persist_dir) and not os.path.exists(
+            self.persist_dir
+        ):
             raise ValueError("知识库不存在，请先构建知识库")
 
         if not self.vector_db.vectordb:
             self.vector_db.load_existing(self.persist_dir)
 
+        fetch_k = adaptive_k.candidate_count(k) if adaptive else k
+        handle = self._acquire_index()
+        try:
+            key = (handle.collection_name, normalize_question(question), fetch_k)
+            docs = self.retrieval_cache.get(key)
+            if docs is None:
+                docs = self._search_collection(
+                    handle.collection_name, question, fetch_k
+                )
+                self.retrieval_cache.put(key, docs)
+        finally:
+            handle.release()
+        if adaptive:
+            docs = adaptive_k.select(docs, band=self.adaptive_band)
+        return docs
+
+    def _build_context(self, question, k, examples, adaptive=False, current=None):
+        if adaptive:
+            # 题库中有原题时直接以原题及答案作为上下文，不再检索知识库
+            match = self.question_bank.find_exact(question)
+            if match and match.get("answer"):
+                logging.info(f"题库命中原题 {match['question_id']}，跳过检索.")
+                if current is not None:
+                    current.set("exact_matches", 1)
+                return [f"例题：\n{format_question(match, with_answer=True)}"]
+
         # 检索相关文档
-        retrieved_docs = self.vector_db.similarity_search(question, k=k)
-        context = [doc.page_content for doc in retrieved_docs]
+        retrieved_docs = self.search(question, k=k, adaptive=adaptive)
+        if current is not None:
+            current.set("chunks", len(retrieved_docs))
+        # 按块编号而不是相似度排列：同一组文档块总是得到相同的提示词，便于服务端复用前缀缓存
+        context = [
+            doc.page_content for doc in sorted(retrieved_docs, key=_canonical_order)
+        ]
 
         logging.info(f"找到 {len(retrieved_docs)} 个相关文档块.")
 
-        # 生成答案
-        answer = self.llm_client.generate_answer(question, context)
-        logging.info(f"生成的答案: {answer}")
+        if examples > 0:
+            example_texts = self.question_bank.examples(question, k=examples)
+            context.extend(f"例题：\n{text}" for text in example_texts)
+            logging.info(f"附加 {len(example_texts)} 道例题.")
+        return context
+
+    def _query(self, key, question, k, examples, adaptive):
+        with span("query") as current:
+            context = self._build_context(question, k, examples, adaptive, current)
 
+            # 生成答案
+            answer = self.llm_client.generate_answer(question, context)
+            logging.info(f"生成的答案: {answer}")
+
+            if adaptive:
+                self.answer_cache.put(key, answer)
+            return answer
+
+    def _query_stream(self, key, question, k, examples, adaptive):
+        with span("query") as current:
+            context = self._build_context(question, k, examples, adaptive, current)
+            pieces = []
+            for text in self.llm_client.stream_answer(question, context):
+                pieces.append(text)
+                yield text
+            if adaptive:
+                self.answer_cache.put(key, "".join(pieces))
+
+    def _cached_answer(self, key):
+        answer = self.answer_cache.get(key)
+        if answer is not None:
+            # 单独计数，不计入 query 阶段的耗时分布，避免命中时的零耗时拉低分位数
+            with span("answer_cache", hits=1):
+                logging.info("答案缓存命中，跳过检索和生成.")
         return answer
 
+    def query(self, question, k=3, examples=0, adaptive=False):
+        """查询知识库并生成答案，examples > 0 时附加题库中的相似例题
+
+        归一化后相同、参数也相同的并发问题只检索和生成一次，共享同一个答案。
+        adaptive=True 时按检索分数自适应地决定文档块数量，并在答案缓存命中或
+        题库精确命中原题时跳过知识库检索。
+        """
+        key = (
+            self.active_collection,
+            normalize_question(question),
+            k,
+            examples,
+            adaptive,
+        )
+        if adaptive:
+            answer = self._cached_answer(key)
+            if answer is not None:
+                return answer
+        return self._inflight.do(
+            key, lambda: self._query(key, question, k, examples, adaptive)
+        )
+
+    def query_stream(self, question, k=3, examples=0, adaptive=False):
+        """流式查询，返回逐段产出答案文本的迭代器；相同的并发问题共享同一个生成流"""
+        key = (
+            self.active_collection,
+            normalize_question(question),
+            k,
+            examples,
+            adaptive,
+        )
+        if adaptive:
+            answer = self._cached_answer(key)
+            if answer is not None:
+                return iter([answer])
+        return self._inflight.stream(
+            key, lambda: self._query_stream(key, question, k, examples, adaptive)
+        )
+
 
 if __name__ == "__main__":
     # 定义项目根目录
-    project_dir = os.path.dirname(
-        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    )
+    project_dir = PROJECT_DIR
 
     # 定义数据路径
     persist_directory = os.path.join(project_dir, "data_base/vector_db/408.db")
@@ -126,15 +446,35 @@ if __name__ == "__main__":
     # "default": 默认切割方式，使用RecursiveCharacterTextSplitter
     # "paper": 按论文结构切割，使用PaperTextSplitter
     # "chapter": 按章节标题切割，使用ChapterTitleSplitter
-    rag_system = RAGSystem(persist_dir=persist_directory, strategy="chapter")
+    # cross_page=True 时 "chapter" 策略按整个文件跨页切割，块元数据记录 page_start/page_end
+    # dedup_threshold 不为 None 时对切割结果做近重复去重（MinHash + LSH）
+    rag_system = RAGSystem(
+        persist_dir=persist_directory,
+        strategy="chapter",
+        cross_page=True,
+        dedup_threshold=0.8,
+    )
 
     # 构建知识库
     logging.info("开始构建知识库...")
     rag_system.build_knowledge_base(data_dir=knowledge_base_dir)
     logging.info("知识库构建完成。")
 
+    # 构建题库检索集合（评测用的 400 题不入库，避免污染评测）
+    question_files = [
+        os.path.join(project_dir, "data/test_data", name)
+        for name in (
+            "computer_408_exam_questions_1000.jsonl",
+            "computer_408_exam_questions_26_1000.jsonl",
+            "network_questions.jsonl",
+        )
+        if os.path.exists(os.path.join(project_dir, "data/test_data", name))
+    ]
+    if question_files and not os.path.exists(rag_system.question_bank.index_path):
+        rag_system.build_question_bank(question_files)
+
     # 执行查询
     logging.info("执行示例查询...")
-    answer = rag_system.query("什么是操作系统？")
+    answer = rag_system.query("什么是操作系统？", examples=2 if question_files else 0)
     logging.info(f"最终答案: {answer}")
     logging.info("查询完成。")
@@ -0,0 +1,111 @@
+"""合并相同的并发请求：同一个 key 同时只执行一次，结果（或流式输出）分发给所有等待者"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Broadcast:
+    """流式输出的共享缓冲：生产线程追加片段，每个消费者从头读起，迟到者也能拿到完整输出"""
+
+    def __init__(self):
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def append(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.error = error
+            self.finished = True
+            self.condition.notify_all()
+
+    def consume(self):
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.finished:
+                    self.condition.wait()
+                pending = self.chunks[index:]
+                finished = self.finished
+            yield from pending
+            index += len(pending)
+            if finished and index >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """同一 key 的并发调用只执行一次
+
+    do(key, fn)：后到的调用等待先到的调用完成，共享返回值或异常。
+    stream(key, fn)：fn 返回迭代器，由后台线程消费一次，片段分发给所有调用者。
+    执行结束后 key 即被移除，之后的调用会重新执行，不做结果缓存。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, fn):
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = self._streams[key] = _Broadcast()
+                threading.Thread(
+                    target=self._produce, args=(key, broadcast, fn), daemon=True
+                ).start()
+            else:
+                self.coalesced += 1
+        return broadcast.consume()
+
+    def _produce(self, key, broadcast, fn):
+        error = None
+        try:
+            for chunk in fn():
+                broadcast.append(chunk)
+        except Exception as e:
+            error = e
+        finally:
+            # 先移除 key 再通知结束，之后到达的调用会重新执行而不是拿到旧结果
+            with self._lock:
+                del self._streams[key]
+            broadcast.finish(error)
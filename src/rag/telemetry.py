@@ -0,0 +1,230 @@
+"""流水线埋点：阶段 span、Prometheus 风格指标和可选的 OpenTelemetry 导出
+
+每个 span 记录阶段耗时（直方图）以及批大小、token 数等数值属性（计数器）。
+默认只在进程内聚合，开销很小；设置环境变量 RAG_TELEMETRY=otel 且安装了
+opentelemetry 时，span 同时转发给 OpenTelemetry（未配置 exporter 时即为 no-op）。
+"""
+
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的分桶上界（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 每个阶段保留的耗时样本数（对全部调用均匀抽样），用于计算分位数
+MAX_SAMPLES = 10000
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_tracer = None
+_prompt_log_rate = None
+
+
+class Histogram:
+    """累计分桶直方图，另用蓄水池抽样（Algorithm R）保留至多 MAX_SAMPLES 个样本用于计算分位数
+
+    每次观测进入样本的概率都相同，分位数反映全部调用而不偏向某一段时间。
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = []
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            # 第 count 个观测以 MAX_SAMPLES / count 的概率替换一个样本
+            slot = random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = value
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Span:
+    """一次阶段调用，可在执行过程中补充属性"""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = False
+        if os.environ.get("RAG_TELEMETRY", "").lower() == "otel":
+            try:
+                from opentelemetry import trace
+
+                _tracer = trace.get_tracer("408rag")
+            except ImportError:
+                pass
+    return _tracer
+
+
+@contextmanager
+def span(name, **attributes):
+    """记录一个处理阶段：耗时计入直方图，数值属性累加到计数器"""
+    current = Span(name, attributes)
+    tracer = _get_tracer()
+    otel_span = tracer.start_as_current_span(name) if tracer else None
+    start = time.perf_counter()
+    try:
+        if otel_span is not None:
+            with otel_span as active:
+                yield current
+                for key, value in current.attributes.items():
+                    active.set_attribute(key, value)
+        else:
+            yield current
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _histograms.setdefault(name, Histogram()).observe(elapsed)
+            for key, value in current.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    counter_key = (name, key)
+                    _counters[counter_key] = _counters.get(counter_key, 0) + value
+
+
+def stage_timings():
+    """返回 {阶段名: (调用次数, 总耗时秒)}"""
+    with _lock:
+        return {name: (h.count, h.sum) for name, h in _histograms.items()}
+
+
+def stage_percentiles(name, quantiles=(50, 95, 99)):
+    """返回阶段耗时的分位数（秒）"""
+    with _lock:
+        histogram = _histograms.get(name)
+        return {q: histogram.percentile(q) if histogram else 0.0 for q in quantiles}
+
+
+def counters():
+    """返回 {(阶段名, 属性名): 累计值}"""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def format_timings():
+    """格式化各阶段耗时，用于 --profile 输出"""
+    lines = [
+        f"{'stage':<16}{'count':>8}{'total(s)':>12}{'avg(ms)':>10}{'p95(ms)':>10}"
+    ]
+    for name, (count, total) in sorted(stage_timings().items()):
+        p95 = stage_percentiles(name, (95,))[95]
+        lines.append(
+            f"{name:<16}{count:>8}{total:>12.3f}"
+            f"{total / count * 1000:>10.1f}{p95 * 1000:>10.1f}"
+        )
+    for (name, key), value in sorted(counters().items()):
+        lines.append(f"{name}.{key} = {value}")
+    return "\n".join(lines)
+
+
+def render_prometheus():
+    """以 Prometheus 文本格式导出全部指标"""
+    lines = [
+        "# HELP rag_stage_duration_seconds Duration of pipeline stages.",
+        "# TYPE rag_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        for name, histogram in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                cumulative += count
+                lines.append(
+                    f'rag_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f'rag_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} '
+                f"{histogram.count}"
+            )
+            lines.append(
+                f'rag_stage_duration_seconds_sum{{stage="{name}"}} {histogram.sum}'
+            )
+            lines.append(
+                f'rag_stage_duration_seconds_count{{stage="{name}"}} {histogram.count}'
+            )
+
+        lines.append("# HELP rag_stage_attribute_total Summed numeric span attributes.")
+        lines.append("# TYPE rag_stage_attribute_total counter")
+        for (name, key), value in sorted(_counters.items()):
+            lines.append(
+                f'rag_stage_attribute_total{{stage="{name}",attribute="{key}"}} {value}'
+            )
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    """写出指标文件（供 node_exporter textfile collector 等采集）"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(path + ".tmp", path)
+
+
+def serve_prometheus(port, host="0.0.0.0"):
+    """在后台线程中提供 /metrics，供长期运行的服务使用"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def prompt_log_rate():
+    """RAG_PROMPT_LOG_RATE（0~1，默认 0），只在首次调用时解析；无法解析时按 0 处理并给出警告"""
+    global _prompt_log_rate
+    if _prompt_log_rate is None:
+        value = os.environ.get("RAG_PROMPT_LOG_RATE", "0")
+        try:
+            _prompt_log_rate = float(value)
+        except ValueError:
+            logging.warning("RAG_PROMPT_LOG_RATE=%r 不是数字，不记录 prompt", value)
+            _prompt_log_rate = 0.0
+    return _prompt_log_rate
+
+
+def should_log_prompt():
+    """按 RAG_PROMPT_LOG_RATE 采样是否记录完整 prompt"""
+    rate = prompt_log_rate()
+    return rate > 0 and random.random() < rate
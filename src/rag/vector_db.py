@@ -1,20 +1,37 @@
 import json
-from pymilvus import CollectionSchema, FieldSchema, MilvusClient, DataType
-from tqdm import tqdm
-from embedding_apis import OpenAIEmbedding
-from langchain.schema import Document
+from embedding_apis import create_embedding
+from telemetry import span
+
+# pymilvus、tqdm、langchain 导入较慢，均在首次使用时再导入，缩短查询进程的启动时间
+
+# 各索引类型的构建参数
+INDEX_PARAMS = {
+    "FLAT": {},
+    "IVF_FLAT": {"nlist": 1024},
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "AUTOINDEX": {},
+}
 
 
 class VectorDatabase:
     def __init__(self, embedding=None, persist_directory=None):
-        self.embedding = embedding if embedding else OpenAIEmbedding()
+        self.embedding = embedding if embedding else create_embedding()
         self.persist_directory = persist_directory
         self.vectordb = None
+        # 集合名 -> 是否带稀疏向量字段
+        self._sparse_fields = {}
 
     def create_from_documents(
-        self, documents, collection_name="rag_collection", persist_directory=None
+        self,
+        documents,
+        collection_name="rag_collection",
+        persist_directory=None,
+        index_type="FLAT",
+        sparse=False,
     ):
-        """从文档创建向量数据库"""
+        """从文档创建向量数据库，sparse=True 时同时存储稀疏向量以支持混合检索"""
+        from pymilvus import CollectionSchema, FieldSchema, MilvusClient, DataType
+
         if persist_directory:
             self.persist_directory = persist_directory
 
@@ -30,16 +47,33 @@ class VectorDatabase:
                 auto_id=True,
                 max_length=100,
             ),
-            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=256),
-            FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=1024),
-            FieldSchema(name="metadata", dtype=DataType.VARCHAR, max_length=256),
+            FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=65535),
+            FieldSchema(
+                name="embedding",
+                dtype=DataType.FLOAT_VECTOR,
+                dim=getattr(self.embedding, "dim", 1024),
+            ),
+            FieldSchema(name="metadata", dtype=DataType.VARCHAR, max_length=65535),
         ]
+        if sparse:
+            fields.append(
+                FieldSchema(name="sparse", dtype=DataType.SPARSE_FLOAT_VECTOR)
+            )
         schema = CollectionSchema(fields, "RAG Collection")
 
         index_params = self.vectordb.prepare_index_params()
         index_params.add_index(
-            field_name="embedding", index_type="FLAT", metric_type="IP"
+            field_name="embedding",
+            index_type=index_type,
+            metric_type="IP",
+            params=INDEX_PARAMS.get(index_type, {}),
         )
+        if sparse:
+            index_params.add_index(
+                field_name="sparse",
+                index_type="SPARSE_INVERTED_INDEX",
+                metric_type="IP",
+            )
 
         # 创建集合（如果不存在）
         if self.vectordb.has_collection(collection_name=collection_name):
@@ -47,54 +81,174 @@ class VectorDatabase:
         self.vectordb.create_collection(
             collection_name=collection_name, schema=schema, index_params=index_params
         )
+        self._sparse_fields[collection_name] = sparse
 
-        embeddings = self.embedding.embed_documents(
-            [doc.page_content for doc in documents]
-        )
-        # 插入文档
-        docs_to_insert = [
-            {
-                "text": doc.page_content,
-                "embedding": embeddings[i],
-                "metadata": json.dumps(doc.metadata),
-            }
-            for i, doc in enumerate(documents)
-        ]
+        self.add_documents(documents, collection_name=collection_name)
+        return self.vectordb
 
-        batch_size = 100
-        for i in tqdm(range(0, len(docs_to_insert), batch_size), desc="插入进度"):
-            batch = docs_to_insert[i : i + batch_size]
-            self.vectordb.insert(collection_name=collection_name, data=batch)
+    def add_documents(self, documents, collection_name="rag_collection"):
+        """向已有集合追加文档，documents 可以是 Chunk 或 langchain Document"""
+        from tqdm import tqdm
 
-        return self.vectordb
+        self._ensure_open()
+        texts = [doc.page_content for doc in documents]
+        sparse = self.has_sparse(collection_name)
+        with span("embed", chunks=len(documents)):
+            if sparse:
+                embeddings, sparse_vectors = self.embedding.embed_hybrid(texts)
+            else:
+                # 稠密向量存放在 float32 矩阵中，插入时才逐批转换为列表
+                embeddings = self.embedding.embed_array(texts)
+
+        # 插入文档，每批的行在插入前才生成，元数据此时才序列化
+        batch_size = 100
+        with span(
+            "insert",
+            rows=len(documents),
+            batches=-(-len(documents) // batch_size),
+        ):
+            for start in tqdm(range(0, len(documents), batch_size), desc="插入进度"):
+                batch = []
+                for i in range(start, min(start + batch_size, len(documents))):
+                    embedding = embeddings[i]
+                    row = {
+                        "text": documents[i].page_content,
+                        "embedding": (
+                            embedding.tolist()
+                            if hasattr(embedding, "tolist")
+                            else embedding
+                        ),
+                        "metadata": json.dumps(
+                            documents[i].metadata, ensure_ascii=False
+                        ),
+                    }
+                    if sparse:
+                        row["sparse"] = sparse_vectors[i]
+                    batch.append(row)
+                self.vectordb.insert(collection_name=collection_name, data=batch)
 
     def load_existing(self, persist_directory):
         """加载已有的向量数据库"""
+        from pymilvus import MilvusClient
+
         self.persist_directory = persist_directory
         self.vectordb = MilvusClient(self.persist_directory)
+        self._sparse_fields = {}
         return self.vectordb
 
+    def _ensure_open(self):
+        """首次使用时打开已有的向量数据库"""
+        if not self.vectordb:
+            if not self.persist_directory:
+                raise ValueError("Vector database not initialized")
+            self.load_existing(self.persist_directory)
+
+    def has_sparse(self, collection_name="rag_collection"):
+        """集合是否带稀疏向量字段（即是否支持混合检索）"""
+        if collection_name not in self._sparse_fields:
+            self._ensure_open()
+            fields = self.vectordb.describe_collection(collection_name)["fields"]
+            self._sparse_fields[collection_name] = any(
+                field["name"] == "sparse" for field in fields
+            )
+        return self._sparse_fields[collection_name]
+
+    @staticmethod
+    def _to_documents(results):
+        from langchain.schema import Document
+
+        documents = []
+        for res in results:
+            for hit in res:
+                metadata = json.loads(hit["metadata"])
+                # 内积相似度，越大越相关；混合检索时为融合后的分数
+                metadata["score"] = hit["distance"]
+                documents.append(Document(page_content=hit["text"], metadata=metadata))
+        return documents
+
     def similarity_search(self, query, k=3, collection_name="rag_collection"):
         """相似度搜索"""
-        if not self.vectordb:
-            raise ValueError("Vector database not initialized")
-
-        query_embedding = self.embedding.embed_query(query)
-        results = self.vectordb.search(
-            collection_name=collection_name,
-            data=[query_embedding],
-            limit=k,
-            output_fields=["text", "metadata"],
-        )
-        return [
-            Document(page_content=hit["text"], metadata=json.loads(hit["metadata"]))
-            for res in results
-            for hit in res
+        self._ensure_open()
+
+        with span("embed_query"):
+            query_embedding = self.embedding.embed_query(query)
+        with span("search") as current:
+            results = self.vectordb.search(
+                collection_name=collection_name,
+                data=[query_embedding],
+                limit=k,
+                output_fields=["text", "metadata"],
+            )
+            current.set("hits", sum(len(res) for res in results))
+        return self._to_documents(results)
+
+    def hybrid_search(
+        self,
+        query,
+        k=3,
+        collection_name="rag_collection",
+        sparse_weight=0.3,
+        candidates=None,
+    ):
+        """稠密 + 稀疏混合检索
+
+        两路各取 candidates（默认 4k）个候选，按 1 : sparse_weight 加权融合后取前 k 个。
+        集合需以 sparse=True 创建。
+        """
+        from pymilvus import AnnSearchRequest, WeightedRanker
+
+        self._ensure_open()
+        candidates = candidates or 4 * k
+
+        with span("embed_query"):
+            dense, sparse = self.embedding.embed_hybrid([query])
+        requests = [
+            AnnSearchRequest(
+                data=dense,
+                anns_field="embedding",
+                param={"metric_type": "IP"},
+                limit=candidates,
+            ),
+            AnnSearchRequest(
+                data=sparse,
+                anns_field="sparse",
+                param={"metric_type": "IP"},
+                limit=candidates,
+            ),
         ]
+        with span("search") as current:
+            results = self.vectordb.hybrid_search(
+                collection_name=collection_name,
+                reqs=requests,
+                ranker=WeightedRanker(1.0, sparse_weight),
+                limit=k,
+                output_fields=["text", "metadata"],
+            )
+            current.set("hits", sum(len(res) for res in results))
+        return self._to_documents(results)
+
+    def list_collections(self):
+        self._ensure_open()
+        return self.vectordb.list_collections()
+
+    def load_collection(self, collection_name):
+        """将集合加载到内存并缓存其字段信息"""
+        self._ensure_open()
+        self.vectordb.load_collection(collection_name=collection_name)
+        self.has_sparse(collection_name)
+
+    def release_collection(self, collection_name):
+        self._ensure_open()
+        self.vectordb.release_collection(collection_name=collection_name)
+
+    def drop_collection(self, collection_name):
+        self._ensure_open()
+        if self.vectordb.has_collection(collection_name=collection_name):
+            self.vectordb.drop_collection(collection_name=collection_name)
+        self._sparse_fields.pop(collection_name, None)
 
     def get_collection_count(self, collection_name="rag_collection"):
         """获取向量库中的文档数量"""
-        if not self.vectordb:
-            raise ValueError("Vector database not initialized")
+        self._ensure_open()
         stats = self.vectordb.get_collection_stats(collection_name)
         return stats["row_count"]